@@ -1,10 +1,11 @@
-import pandas as pd
-from datetime import datetime
+import time
 
-from basic_playlist import BasicPlaylist
-from favourite_songs import FavouriteSongsPlaylist
-from recommendation_model import RecommendationModel
-from evaluation_in_app import evaluate
+started = time.perf_counter()
+
+import argparse  # noqa: E402
+from datetime import datetime  # noqa: E402
+
+from app_state import AppState  # noqa: E402
 
 
 basic_playlists_path = './generated_playlists/basic_playlists/'
@@ -13,10 +14,33 @@ model_playlists_path = './generated_playlists/model_playlists/'
 
 print('Loading data...')
 
-artists_df = pd.read_json('./preprocessed_data/artists.json')
-tracks_df = pd.read_json('./preprocessed_data/tracks.json')
-users_df = pd.read_json('./preprocessed_data/users.json')
-sessions_df = pd.read_json('./preprocessed_data/sessions.json')
+imported = time.perf_counter()
+state = AppState.load()
+loaded = time.perf_counter()
+artists_df = state.artists_df
+tracks_df = state.tracks_df
+users_df = state.users_df
+sessions_df = state.sessions_df
+
+
+# startup times printed with --profile-startup
+startup_profile = {'enabled': False, 'prompted': False, 'playlist': False}
+
+
+def profile_first_prompt():
+    if startup_profile['enabled'] and not startup_profile['prompted']:
+        startup_profile['prompted'] = True
+        print(f'\n[startup] imports: {imported - started:.3f} s, '
+              f'loading data: {loaded - imported:.3f} s, '
+              f'time to first prompt: {time.perf_counter() - started:.3f} s')
+
+
+def profile_first_playlist(seconds):
+    if startup_profile['enabled'] and not startup_profile['playlist']:
+        startup_profile['playlist'] = True
+        print(f'[startup] first playlist created in {seconds:.3f} s, '
+              f'time to first playlist (without waiting for input): '
+              f'{loaded - started + seconds:.3f} s')
 
 
 def save_playlist_to_file(playlist, filepath):
@@ -24,32 +48,16 @@ def save_playlist_to_file(playlist, filepath):
 
 
 def get_basic_playlist(users_id, playlist_duration):
-    basic_playlist = BasicPlaylist(
-        artists_df, sessions_df, tracks_df, users_df,
-        users_id, playlist_duration)
-    created_basic_playlist = basic_playlist.create_full_basic_playlist()
-
-    return created_basic_playlist
+    return state.get_basic_playlist(users_id, playlist_duration)
 
 
 def get_model_playlist(users_id, playlist_duration):
-    fav_songs_playlist = FavouriteSongsPlaylist(
-        artists_df, sessions_df, tracks_df, users_df,
-        users_id, playlist_duration)
-    created_first_part_playlist = fav_songs_playlist \
-        .create_first_part_playlist()
-    first_part_playlist_list = created_first_part_playlist['id'].tolist()
-
-    model_playlist = RecommendationModel(
-        first_part_playlist_list, tracks_df, playlist_duration)
-    created_model_playlist = model_playlist.create_playlist()
-
-    return created_model_playlist
+    return state.get_model_playlist(users_id, playlist_duration)
 
 
 def eval(users_id, playlist_duration):
     print('\nKalkulowanie...\n')
-    evaluate(artists_df, tracks_df, sessions_df, users_df, users_id, playlist_duration)
+    state.evaluate(users_id, playlist_duration)
 
 
 def choice_screen():
@@ -58,6 +66,7 @@ def choice_screen():
     2 - Porównaj modele\n \
     x - Zakończ pracę')
 
+    profile_first_prompt()
     action = input('Wybór: ')
 
     if action in ['1', '2']:
@@ -87,12 +96,14 @@ def choice_screen():
             playlist_action = input('Wybór: ')
 
             if playlist_action in ['1', '2']:
+                creating = time.perf_counter()
                 if playlist_action == '1':  # Basic playlist
                     playlist = get_basic_playlist(users_id, (hours, minutes))
                     filepath = basic_playlists_path
                 elif playlist_action == '2':  # Playlist from recommendation model
                     playlist = get_model_playlist(users_id, (hours, minutes))
                     filepath = model_playlists_path
+                profile_first_playlist(time.perf_counter() - creating)
 
                 print('\nWasza spersonalizowana playlista:')
                 print(playlist['name'])
@@ -116,5 +127,15 @@ def choice_screen():
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Playlists for groups')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='print time to first prompt and playlist')
+    parser.add_argument('--save-snapshot', action='store_true',
+                        help='save loaded data as snapshot for fast startup')
+    args = parser.parse_args()
+    startup_profile['enabled'] = args.profile_startup
+    if args.save_snapshot:
+        print(f'Snapshot saved to {state.save_snapshot()}')
+
     print('\nWitamy w playlistach dla grup Pozytywki!')
     choice_screen()
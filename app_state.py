@@ -0,0 +1,180 @@
+import threading
+
+import pandas as pd
+
+from basic_playlist import BasicPlaylist
+from catalogue import Catalogue
+from evaluation_in_app import evaluate, evaluate_models, get_evaluation_split
+from favourite_songs import FavouriteSongsPlaylist
+from feature_store import FeatureStore
+from playlist_cache import CandidatePool, PlaylistCache
+from recommendation_model import RecommendationModel
+from similarity import CosineSimilarity
+from storage import (APP_COLUMNS, PREPROCESSED_PATH, compact_df, load_df,
+                     load_snapshot, save_snapshot)
+from track_index import TrackIndex
+from user_histories import HistoryCache, set_interactions
+
+
+class AppState:
+    """
+    loaded dataframes together with structures built from them
+    (track index, histories cache, feature store, similarity),
+    loaded once and shared by every playlist request, numeric arrays
+    are memory-mapped from the catalogue so processes share them
+    """
+    def __init__(self, artists_df, tracks_df, users_df, sessions_df,
+                 path: str = PREPROCESSED_PATH):
+        self.artists_df = artists_df
+        self.tracks_df = tracks_df
+        self.users_df = users_df
+        self.sessions_df = sessions_df
+        self.path = path
+        self.history_cache = HistoryCache()
+        self.feature_store = FeatureStore.load_or_build(tracks_df, path)
+        self.catalogue = Catalogue.load_or_build(
+            tracks_df, sessions_df, self.feature_store, path)
+        self.track_index = TrackIndex(tracks_df, self.catalogue.durations)
+        self.similarity = CosineSimilarity(
+            self.catalogue.unit_features, normalized=True,
+            genres=self.catalogue.unit_genres(),
+            genres_t=self.catalogue.unit_genres_t())
+        set_interactions(sessions_df, self.catalogue.interactions())
+        self.playlist_cache = PlaylistCache()
+        self._sessions_lock = threading.Lock()
+        self.user_ids = set(users_df['user_id'].tolist())
+
+    dataframes = ('artists', 'tracks', 'users', 'sessions')
+
+    @classmethod
+    def load(cls, path: str = PREPROCESSED_PATH) -> 'AppState':
+        """
+        method loads preprocessed data with columns needed by the app,
+        from the snapshot if it was saved and data did not change since
+        :param path: directory with preprocessed data
+        :return: loaded state
+        """
+        dfs = load_snapshot(cls.dataframes, path)
+        if dfs is None:
+            dfs = {name: load_df(name, path, APP_COLUMNS[name])
+                   for name in cls.dataframes}
+        return cls(*(dfs[name] for name in cls.dataframes), path)
+
+    def save_snapshot(self) -> str:
+        """
+        method saves loaded dataframes as snapshot used by next loads
+        :return: path of the snapshot
+        """
+        return save_snapshot(
+            {name: getattr(self, name + '_df') for name in self.dataframes},
+            self.path)
+
+    def unknown_users(self, users_id) -> list:
+        """
+        :return: ids of given users which are not in users dataframe
+        """
+        return [user_id for user_id in users_id
+                if user_id not in self.user_ids]
+
+    def add_sessions(self, new_sessions_df) -> int:
+        """
+        method appends new sessions, cached playlists candidates
+        of groups with any of their users are removed (interactions and
+        histories of all users are built again for the new sessions
+        dataframe, not only of the users with new sessions)
+        :param new_sessions_df: preprocessed sessions
+        :return: number of all sessions
+        """
+        with self._sessions_lock:
+            self.sessions_df = compact_df(pd.concat(
+                [self.sessions_df, new_sessions_df], ignore_index=True),
+                'sessions')
+            self.playlist_cache.invalidate(
+                new_sessions_df['user_id'].unique().tolist())
+            return len(self.sessions_df)
+
+    def clear_caches(self) -> None:
+        """
+        method removes cached histories and candidate pools
+        """
+        self.history_cache.invalidate()
+        self.playlist_cache.invalidate()
+
+    def basic_playlist(self, users_id, playlist_duration) -> BasicPlaylist:
+        return BasicPlaylist(
+            self.artists_df, self.sessions_df, self.tracks_df, self.users_df,
+            users_id, playlist_duration, self.track_index, self.history_cache)
+
+    def favourite_songs_playlist(self, users_id, playlist_duration) \
+            -> FavouriteSongsPlaylist:
+        return FavouriteSongsPlaylist(
+            self.artists_df, self.sessions_df, self.tracks_df, self.users_df,
+            users_id, playlist_duration, self.track_index, self.history_cache)
+
+    def recommendation_model(self, first_part_playlist, playlist_duration) \
+            -> RecommendationModel:
+        return RecommendationModel(
+            first_part_playlist, self.tracks_df, playlist_duration,
+            self.track_index, self.similarity, self.feature_store)
+
+    def build_model_pool(self, users_id, playlist_duration) -> CandidatePool:
+        """
+        method finds favourite songs of users enough for given duration
+        and ranks recommendations to all of them in one batch,
+        as deep as the model needs for given duration
+        """
+        fav_songs_playlist = self.favourite_songs_playlist(
+            users_id, playlist_duration)
+        favourites = fav_songs_playlist.first_part_candidates()
+        packing = fav_songs_playlist.packing
+
+        model_playlist = self.recommendation_model(
+            packing.songs, playlist_duration)
+        depth = model_playlist.ranking_depth_for(
+            model_playlist.estimate_recommendation_nr(packing.duration))
+        positions = self.track_index.get_positions(favourites)
+        recommendations = dict(zip(
+            favourites, self.similarity.top_k(positions, depth)))
+        return CandidatePool(favourites, recommendations, depth)
+
+    def get_basic_playlist(self, users_id, playlist_duration):
+        # songs are drawn for every request from cached histories,
+        # so the same group gets different playlists
+        basic_playlist = self.basic_playlist(users_id, playlist_duration)
+        return basic_playlist.create_full_basic_playlist()
+
+    def get_model_playlist(self, users_id, playlist_duration):
+        pool = self.playlist_cache.get_pool(
+            'model', users_id, playlist_duration, self.build_model_pool)
+        fav_songs_playlist = self.favourite_songs_playlist(
+            users_id, playlist_duration)
+        created_first_part_playlist = fav_songs_playlist \
+            .create_first_part_playlist(pool.favourites)
+        first_part_playlist_list = created_first_part_playlist['id'].tolist()
+
+        model_playlist = self.recommendation_model(
+            first_part_playlist_list, playlist_duration)
+        model_playlist.use_ranking(pool.recommendations, pool.depth)
+        return model_playlist.create_playlist()
+
+    @property
+    def evaluation_split(self):
+        """
+        split of sessions used in evaluation, computed on first use
+        and reused while sessions dataframe is the same
+        """
+        return get_evaluation_split(
+            self.sessions_df, self.tracks_df, self.artists_df)
+
+    def evaluate(self, users_id, playlist_duration):
+        evaluate(self.artists_df, self.tracks_df, self.sessions_df,
+                 self.users_df, users_id, playlist_duration,
+                 self.track_index, self.history_cache, self.similarity,
+                 self.feature_store, self.evaluation_split)
+
+    def evaluate_models(self, users_id, playlist_duration) -> dict:
+        return evaluate_models(
+            self.artists_df, self.tracks_df, self.sessions_df,
+            self.users_df, users_id, playlist_duration,
+            self.track_index, self.history_cache, self.similarity,
+            self.feature_store, self.evaluation_split)
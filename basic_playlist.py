@@ -1,7 +1,8 @@
 import pandas as pd
-import random
 
+from instrumentation import observe, stage, timed
 from playlist import Playlist
+from user_histories import played_histories
 
 
 class BasicPlaylist(Playlist):
@@ -14,22 +15,7 @@ class BasicPlaylist(Playlist):
         :user_id: id of the user
         :return: dataframe with history of tracks listened by user
         """
-        user_session_df = self.sessions_df.loc[
-            self.sessions_df['user_id'] == user_id]
-
-        user_history = dict()
-
-        for idx, row in user_session_df.iterrows():
-            track = row['track_id']
-            if track not in user_history:
-                user_history[track] = 0
-            if row['event_type'] == 'play':
-                user_history[track] += 1
-
-        user_history = pd.DataFrame.from_dict(
-            user_history, orient='index')
-
-        return user_history
+        return played_histories(self.sessions_df, [user_id])[0]
 
     def generate_users_histories(self) -> list:
         """
@@ -37,53 +23,55 @@ class BasicPlaylist(Playlist):
         all tracks listened by specified users
         :return: list of track history of every user
         """
-        users_histories = []
-        for user_id in self.users_id:
-            users_histories.append(self.create_user_history(user_id))
-        return users_histories
+        with stage('playlist.histories'):
+            return self.history_cache.get_histories(
+                self.sessions_df, self.users_id, played_histories)
 
     # Create playlist
 
-    def create_playlist_user_history(self, songs_per_user: int) -> list:
+    def users_candidates(self, songs_per_user: int) -> list:
         """
-        method creates playlist based on users favourite songs
-        and excluding disliked tracks
-        :return: list of songs ids
+        method draws random songs from history of every user
+        :return: list with list of random songs ids of every user
         """
         users_histories = self.generate_users_histories()
-        basic_playlist = []
-        for user_history in users_histories:
-            basic_playlist.extend(list(
-                user_history
-                .sample(n=songs_per_user, replace=True)
-                .index))
-
-        return basic_playlist
-
-    def create_full_basic_playlist(self) -> pd.DataFrame:
-        basic_playlist_df = self.create_first_part_playlist()
+        return [list(user_history
+                     .sample(n=songs_per_user, replace=True)
+                     .index)
+                for user_history in users_histories]
+
+    @timed('basic.full_playlist')
+    def create_full_basic_playlist(self, candidates: list = None) \
+            -> pd.DataFrame:
+        """
+        creates playlist from songs known by users and fills
+        the remaining time with random songs, so the duration is
+        within +/- 5 min of the playlist duration
+        :param candidates: songs known by users ordered by relevance
+        (like cached ones), if None they are drawn from users histories
+        :return: dataframe with songs of the playlist
+        """
+        basic_playlist_df = self.create_first_part_playlist(candidates)
         basic_playlist = basic_playlist_df['id'].tolist()
         duration = self.count_duration(basic_playlist)
 
         remaining_time = self.playlist_duration - duration
-        remaining_songs_estimate = remaining_time / self.median_song_duration
-
-        basic_playlist.extend(list(
-            self.tracks_df
-            .sample(n=int(remaining_songs_estimate), replace=True)
-            ['id']))
-
-        duration = self.count_duration(basic_playlist)
-
-        while duration > self.playlist_duration + 300 or duration < self.playlist_duration - 300:
-            if duration > self.playlist_duration + 300:
-                basic_playlist.pop(
-                    random.randrange(len(basic_playlist)))
-            else:
-                basic_playlist.extend(list(
-                    self.tracks_df
-                    .sample(n=1, replace=True)
-                    ['id']))
-            duration = self.count_duration(basic_playlist)
-
-        return self.tracks_df.loc[self.tracks_df['id'].isin(basic_playlist)]
+        remaining_songs_estimate = max(
+            int(remaining_time / self.median_song_duration), 0)
+
+        with stage('basic.random_candidates'):
+            other_tracks_df = self.tracks_df.loc[
+                ~self.tracks_df['id'].isin(basic_playlist)]
+            extra_songs = list(
+                other_tracks_df
+                .sample(n=min(remaining_songs_estimate * 2 + 10,
+                              len(other_tracks_df)))
+                ['id'])
+        observe('basic.random_candidates', len(extra_songs))
+        packing = self.pack_songs(
+            extra_songs, self.playlist_duration, 300, duration)
+        basic_playlist.extend(packing.songs)
+
+        with stage('playlist.filter_tracks'):
+            return self.tracks_df.loc[
+                self.tracks_df['id'].isin(basic_playlist)]
@@ -0,0 +1,175 @@
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from app_state import AppState
+from instrumentation import instrumentation
+from storage import PREPROCESSED_PATH
+from worker_pool import get_state, run_tasks
+
+
+METRICS = ['predicted_percent', 'artist_indicator', 'genre_indicator']
+
+
+def load_cases(filepath: str) -> list:
+    """
+    function loads evaluation cases from json (list) or json lines file,
+    every case looks like {"users": [121, 169], "duration": [2, 30]}
+    :return: list of (users_id, (hours, minutes)) cases
+    """
+    with open(filepath) as cases_file:
+        content = cases_file.read().strip()
+    if content.startswith('['):
+        cases = json.loads(content)
+    else:
+        cases = [json.loads(line) for line in content.splitlines() if line]
+    return [(case['users'], tuple(case['duration'])) for case in cases]
+
+
+def sample_cases(users: list, cases_nr: int, seed: int = 0,
+                 min_users: int = 2, max_users: int = 9,
+                 min_hours: int = 1, max_hours: int = 9) -> list:
+    """
+    function draws random evaluation cases
+    :param users: ids of users to draw groups from
+    :param cases_nr: number of cases
+    :param seed: seed of random generator
+    :return: list of (users_id, (hours, minutes)) cases
+    """
+    generator = random.Random(seed)
+    cases = []
+    for _ in range(cases_nr):
+        group_size = generator.randint(min_users, min(max_users, len(users)))
+        users_id = generator.sample(users, group_size)
+        duration = (generator.randint(min_hours, max_hours),
+                    generator.randint(0, 59))
+        cases.append((users_id, duration))
+    return cases
+
+
+def evaluate_case(task: tuple) -> dict:
+    """
+    function evaluates both models for one case
+    :param task: (case number, seed, users_id, playlist_duration)
+    :return: dict with case and metrics of every model
+    """
+    case_nr, seed, users_id, playlist_duration = task
+    random.seed(seed + case_nr)
+    np.random.seed((seed + case_nr) % 2**32)
+
+    result = {'case': case_nr, 'users': users_id,
+              'duration': list(playlist_duration)}
+    start = time.perf_counter()
+    try:
+        result['models'] = get_state().evaluate_models(
+            users_id, playlist_duration)
+    except Exception as error:
+        result['error'] = repr(error)
+    result['seconds'] = time.perf_counter() - start
+    if instrumentation.enabled:
+        # events are sent back, because workers have own registries
+        result['events'] = instrumentation.events()
+        instrumentation.reset()
+    return result
+
+
+def run_batch(state: AppState, cases: list, workers: int = 1,
+              seed: int = 0, path: str = PREPROCESSED_PATH) -> list:
+    """
+    function evaluates all cases in a pool of processes
+    :param state: loaded app state shared by workers
+    :param cases: list of (users_id, (hours, minutes)) cases
+    :param workers: number of worker processes
+    :param seed: seed of random generators in every case
+    :return: list of results of every case in order of cases
+    """
+    # computed before forking, so every worker reuses the same split
+    state.evaluation_split
+    tasks = [(case_nr, seed, users_id, duration)
+             for case_nr, (users_id, duration) in enumerate(cases)]
+    instrumentation.reset()
+    results = list(run_tasks(state, evaluate_case, tasks, workers, path))
+
+    for result in results:
+        instrumentation.add_events(result.pop('events', []))
+    return results
+
+
+def aggregate(results: list) -> pd.DataFrame:
+    """
+    function aggregates metrics of all cases per model
+    :return: dataframe with one row per model
+    """
+    rows = []
+    for result in results:
+        for model, metrics in result.get('models', {}).items():
+            rows.append(dict(model=model, **metrics))
+    if not rows:
+        return pd.DataFrame(columns=['model', 'cases'])
+
+    metrics_df = pd.DataFrame(rows)
+    grouped = metrics_df.groupby('model')
+    summary = grouped[METRICS].mean()
+    summary.insert(0, 'cases', grouped.size())
+    summary['total_predicted_percent'] = \
+        100 * grouped['predicted'].sum() / grouped['playlist_length'].sum()
+    summary['failed_cases'] = sum('error' in result for result in results)
+    return summary.reset_index()
+
+
+def save_results(summary: pd.DataFrame, results: list, filepath: str) -> None:
+    """
+    function saves aggregated metrics to csv, or to json
+    together with results of every case
+    """
+    if filepath.endswith('.csv'):
+        summary.to_csv(filepath, index=False)
+        return
+    with open(filepath, 'w') as results_file:
+        json.dump({'summary': summary.to_dict(orient='records'),
+                   'cases': results}, results_file, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Evaluate playlist models for many groups at once')
+    parser.add_argument('--cases', help='json or json lines file with cases')
+    parser.add_argument('--sample', type=int, default=10,
+                        help='number of random cases if no file is given')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--data', default=PREPROCESSED_PATH)
+    parser.add_argument('--output', default='evaluation_results.json',
+                        help='csv or json file with aggregated metrics')
+    parser.add_argument('--instrument',
+                        help='json lines file for timings of every stage')
+    args = parser.parse_args()
+    if args.instrument:
+        instrumentation.enable()
+
+    state = AppState.load(args.data)
+    if args.cases:
+        cases = load_cases(args.cases)
+    else:
+        cases = sample_cases(
+            state.users_df['user_id'].tolist(), args.sample, args.seed)
+
+    start = time.perf_counter()
+    results = run_batch(state, cases, args.workers, args.seed, args.data)
+    summary = aggregate(results)
+    save_results(summary, results, args.output)
+
+    print(summary.to_string(index=False))
+    if args.instrument:
+        instrumentation.export(args.instrument)
+        print(instrumentation.report() + '\n')
+    print(f'\n{len(cases)} cases in {time.perf_counter() - start:.2f} s, '
+          f'saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+import argparse
+import csv
+import json
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from app_state import AppState
+from storage import PREPROCESSED_PATH
+from worker_pool import get_state, run_tasks
+
+
+PLAYLIST_TYPES = ('basic', 'model')
+TRACK_COLUMNS = ['job', 'type', 'users', 'position', 'id', 'name',
+                 'duration_sec']
+
+
+def parse_job(job: dict) -> tuple:
+    """
+    function reads job from json object or csv row, in csv users are
+    separated with spaces and duration is given by hours and minutes
+    columns
+    :return: (users_id, (hours, minutes), playlist type)
+    """
+    users = job['users']
+    if isinstance(users, str):
+        users = users.split()
+    if 'duration' in job:
+        hours, minutes = job['duration']
+    else:
+        hours, minutes = job['hours'], job.get('minutes') or 0
+    playlist_type = job.get('type') or 'model'
+    if playlist_type not in PLAYLIST_TYPES:
+        raise ValueError(f'Unknown playlist type: {playlist_type}')
+    return [int(user_id) for user_id in users], \
+        (int(hours), int(minutes)), playlist_type
+
+
+def load_jobs(filepath: str) -> list:
+    """
+    function loads jobs from json lines file, like
+    {"users": [121, 169], "duration": [2, 30], "type": "basic"}
+    or from csv file with users, hours, minutes and type columns
+    :return: list of (users_id, (hours, minutes), playlist type) jobs
+    """
+    with open(filepath, newline='') as jobs_file:
+        if filepath.endswith('.csv'):
+            jobs = list(csv.DictReader(jobs_file))
+        else:
+            jobs = [json.loads(line) for line in jobs_file if line.strip()]
+    return [parse_job(job) for job in jobs]
+
+
+def run_job(task: tuple) -> dict:
+    """
+    function creates one playlist
+    :param task: (job number, seed, users_id, playlist_duration, type)
+    :return: dict with job and songs of the playlist or error
+    """
+    job_nr, seed, users_id, playlist_duration, playlist_type = task
+    random.seed(seed + job_nr)
+    np.random.seed((seed + job_nr) % 2**32)
+
+    result = {'job': job_nr, 'type': playlist_type, 'users': users_id,
+              'duration': list(playlist_duration)}
+    start = time.perf_counter()
+    state = get_state()
+    try:
+        unknown = state.unknown_users(users_id)
+        if unknown:
+            raise ValueError(f'unknown users: {unknown}')
+        if playlist_type == 'basic':
+            playlist = state.get_basic_playlist(users_id, playlist_duration)
+        else:
+            playlist = state.get_model_playlist(users_id, playlist_duration)
+        result['duration_sec'] = int(playlist['duration_sec'].sum())
+        result['tracks'] = playlist[['id', 'name', 'duration_sec']] \
+            .to_dict(orient='list')
+    except Exception as error:
+        result['error'] = repr(error)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def run_jobs(state: AppState, jobs: list, workers: int = 1, seed: int = 0,
+             path: str = PREPROCESSED_PATH):
+    """
+    function creates playlists of all jobs in a pool of processes
+    :param state: loaded app state shared by workers
+    :param jobs: list of (users_id, (hours, minutes), type) jobs
+    :param workers: number of worker processes
+    :return: generator of results in order of completion
+    """
+    tasks = [(job_nr, seed, users_id, duration, playlist_type)
+             for job_nr, (users_id, duration, playlist_type)
+             in enumerate(jobs)]
+    return run_tasks(state, run_job, tasks, workers, path, ordered=False)
+
+
+def tracks_rows(result: dict) -> pd.DataFrame:
+    """
+    function changes playlist of the result to rows with one song each
+    """
+    tracks = result['tracks']
+    return pd.DataFrame({
+        'job': result['job'],
+        'type': result['type'],
+        'users': ' '.join(map(str, result['users'])),
+        'position': np.arange(len(tracks['id'])),
+        'id': tracks['id'],
+        'name': tracks['name'],
+        'duration_sec': np.asarray(tracks['duration_sec'], dtype=np.int64)},
+        columns=TRACK_COLUMNS)
+
+
+class ResultsWriter:
+    """
+    writes results to one file as they come: json lines with one
+    playlist per line, or csv/parquet with one song per row
+    (failed jobs are only in json lines)
+    """
+    file_formats = ('jsonl', 'csv', 'parquet')
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.file_format = filepath.rsplit('.', 1)[-1]
+        if self.file_format not in self.file_formats:
+            raise ValueError(
+                f'Unknown file format: {self.file_format}, '
+                f'expected one of {self.file_formats}')
+        self._file = None
+        self._parquet = None
+        if self.file_format in ('jsonl', 'csv'):
+            self._file = open(filepath, 'w', newline='')
+
+    def write(self, result: dict) -> None:
+        if self.file_format == 'jsonl':
+            self._file.write(json.dumps(result) + '\n')
+            return
+        if 'error' in result:
+            return
+
+        rows = tracks_rows(result)
+        if self.file_format == 'csv':
+            rows.to_csv(self._file, index=False,
+                        header=self._file.tell() == 0)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(rows, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.filepath, table.schema)
+            self._parquet.write_table(table)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Create many playlists from a file with jobs')
+    parser.add_argument('jobs', help='json lines or csv file with jobs')
+    parser.add_argument('--output', default='playlists.jsonl',
+                        help='jsonl, csv or parquet file with playlists')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data', default=PREPROCESSED_PATH)
+    args = parser.parse_args()
+
+    jobs = load_jobs(args.jobs)
+    writer = ResultsWriter(args.output)
+    state = AppState.load(args.data)
+
+    start = time.perf_counter()
+    created, failed = 0, 0
+    try:
+        for result in run_jobs(state, jobs, args.workers, args.seed,
+                               args.data):
+            writer.write(result)
+            if 'error' in result:
+                failed += 1
+                print(f'job {result["job"]} failed: {result["error"]}')
+            else:
+                created += 1
+    finally:
+        writer.close()
+    seconds = time.perf_counter() - start
+
+    print(f'{created} playlists created, {failed} failed '
+          f'in {seconds:.2f} s ({created / seconds:.2f} playlists/s), '
+          f'saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
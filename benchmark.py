@@ -0,0 +1,287 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from app_state import AppState
+from basic_playlist import BasicPlaylist
+from favourite_songs import FavouriteSongsPlaylist
+from preprocess import Preprocess
+from recommendation_model import RecommendationModel
+from storage import PREPROCESSED_PATH
+from synthetic_data import generate_data
+
+
+GROUP_SIZES = range(2, 10)
+DURATIONS = range(1, 10)
+
+
+def seed_all(seed: int) -> None:
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def measure(function, repeat: int = 1, seed: int = 0, setup=None,
+            clear=None) -> tuple:
+    """
+    function times given function, every run starts with the same seed,
+    so it does the same work, the last run is traced to find peak memory
+    :param function: function without arguments, or taking the result
+    of setup if it is given
+    :param repeat: number of timed runs
+    :param setup: function called before every run, not timed
+    :param clear: function clearing caches before every run (not timed),
+    so every run is cold instead of reusing the previous run's work
+    :return: (result of the last run, dict with wall times and peak memory)
+    """
+    def run():
+        if clear is not None:
+            clear()
+        seed_all(seed)
+        if setup is None:
+            return function, ()
+        return function, (setup(),)
+
+    times = []
+    for _ in range(repeat):
+        run_function, arguments = run()
+        start = time.perf_counter()
+        run_function(*arguments)
+        times.append(time.perf_counter() - start)
+
+    run_function, arguments = run()
+    tracemalloc.start()
+    try:
+        result = run_function(*arguments)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return result, {
+        'seconds': min(times),
+        'mean_seconds': sum(times) / len(times),
+        'peak_memory_mb': peak / 2**20}
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_preprocess(paths: dict, repeat: int) -> dict:
+    """
+    function times preprocessing of generated raw data,
+    preprocessed data is saved in the current directory
+    """
+    os.makedirs(PREPROCESSED_PATH, exist_ok=True)
+
+    def preprocess():
+        data = Preprocess(paths['artists'], paths['sessions'],
+                          paths['tracks'], paths['users'])
+        data.preprocess()
+        return data
+
+    data, stats = measure(preprocess, repeat)
+    stats['iterations'] = {
+        'tracks': len(data.tracks_df),
+        'sessions': len(data.session_df),
+        'genres': len(data.genre_columns)}
+    return stats
+
+
+def benchmark_case(state: AppState, users_id: list, playlist_duration: tuple,
+                   repeat: int, seed: int) -> dict:
+    """
+    function times every stage of playlists creation and evaluation
+    for one group of users and playlist duration, histories and
+    playlists caches are cleared before every run
+    :return: dict with stats of every stage
+    """
+    stages = dict()
+    clear = state.clear_caches
+
+    def basic_playlist():
+        playlist = BasicPlaylist(
+            state.artists_df, state.sessions_df, state.tracks_df,
+            state.users_df, users_id, playlist_duration,
+            state.track_index, state.history_cache)
+        return playlist, playlist.create_full_basic_playlist()
+
+    (playlist, songs), stages['basic_playlist'] = measure(
+        basic_playlist, repeat, seed, clear=clear)
+    stages['basic_playlist']['iterations'] = {
+        'packing': playlist.packing.iterations, 'songs': len(songs)}
+
+    def first_part_playlist():
+        playlist = FavouriteSongsPlaylist(
+            state.artists_df, state.sessions_df, state.tracks_df,
+            state.users_df, users_id, playlist_duration,
+            state.track_index, state.history_cache)
+        return playlist, playlist.create_first_part_playlist()
+
+    (playlist, songs), stages['first_part_playlist'] = measure(
+        first_part_playlist, repeat, seed, clear=clear)
+    stages['first_part_playlist']['iterations'] = {
+        'packing': playlist.packing.iterations, 'songs': len(songs)}
+    first_part = songs['id'].tolist()
+
+    def model_init():
+        return RecommendationModel(
+            first_part, state.tracks_df, playlist_duration,
+            state.track_index, state.similarity, state.feature_store)
+
+    _, stages['model_init'] = measure(
+        model_init, repeat, seed, clear=clear)
+
+    def model_playlist(model):
+        return model, model.create_playlist()
+
+    (model, songs), stages['model_playlist'] = measure(
+        model_playlist, repeat, seed, setup=model_init, clear=clear)
+    stages['model_playlist']['iterations'] = {
+        'packing': model.packing.iterations,
+        'ranking_depth': model.ranking[1] if model.ranking else 0,
+        'songs': len(songs)}
+
+    def evaluate():
+        return state.evaluate_models(users_id, playlist_duration)
+
+    _, stages['evaluate'] = measure(
+        evaluate, repeat, seed, clear=clear)
+    return stages
+
+
+def summarize(cases: list) -> dict:
+    """
+    function aggregates stats of every stage over all cases
+    """
+    rows = [dict(stage=stage, **stats)
+            for case in cases for stage, stats in case['stages'].items()]
+    stages_df = pd.DataFrame(rows).drop(columns='iterations')
+    grouped = stages_df.groupby('stage', sort=False)
+    summary = pd.DataFrame({
+        'mean_seconds': grouped['seconds'].mean(),
+        'max_seconds': grouped['seconds'].max(),
+        'max_peak_memory_mb': grouped['peak_memory_mb'].max()})
+    return summary.to_dict(orient='index')
+
+
+def run_benchmark(scale: dict, group_sizes=GROUP_SIZES, durations=DURATIONS,
+                  repeat: int = 3, seed: int = 0) -> dict:
+    """
+    function generates data at given scale in temporary directory and
+    benchmarks preprocessing and playlists for every group size
+    and duration (in hours)
+    :param scale: numbers of tracks, artists, users and sessions
+    :return: dict with benchmark results
+    """
+    results = {
+        'commit': get_commit(),
+        'created': pd.Timestamp.now().isoformat(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'scale': scale,
+        'repeat': repeat,
+        'seed': seed,
+        'caches': 'cleared before every run'}
+
+    working_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            paths = generate_data(os.path.join(directory, 'data'),
+                                  seed=seed, **scale)
+            results['preprocess'] = benchmark_preprocess(paths, repeat)
+
+            state = AppState.load()
+            users = state.users_df['user_id'].tolist()
+            generator = random.Random(seed)
+            cases = []
+            for group_size in group_sizes:
+                for hours in durations:
+                    users_id = generator.sample(users, group_size)
+                    stages = benchmark_case(
+                        state, users_id, (hours, 0), repeat, seed)
+                    cases.append({'group_size': group_size, 'hours': hours,
+                                  'users': users_id, 'stages': stages})
+        finally:
+            os.chdir(working_dir)
+
+    results['summary'] = summarize(cases)
+    results['cases'] = cases
+    return results
+
+
+def compare(results: dict, baseline: dict) -> pd.DataFrame:
+    """
+    function compares summary of results with results of earlier run
+    :return: dataframe with mean times and their ratio for every stage
+    """
+    stages = {'preprocess': {'mean_seconds': results['preprocess']['seconds']}}
+    stages.update(results['summary'])
+    baseline_stages = {
+        'preprocess': {'mean_seconds': baseline['preprocess']['seconds']}}
+    baseline_stages.update(baseline['summary'])
+
+    rows = []
+    for stage, stats in stages.items():
+        if stage not in baseline_stages:
+            continue
+        before = baseline_stages[stage]['mean_seconds']
+        after = stats['mean_seconds']
+        rows.append({'stage': stage, 'baseline_seconds': before,
+                     'seconds': after,
+                     'ratio': after / before if before else float('nan')})
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark playlists creation on synthetic data')
+    parser.add_argument('--tracks', type=int, default=10000)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--sessions', type=int, default=100000)
+    parser.add_argument('--group-sizes', type=int, nargs='+',
+                        default=list(GROUP_SIZES))
+    parser.add_argument('--hours', type=int, nargs='+',
+                        default=list(DURATIONS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='results of earlier run')
+    args = parser.parse_args()
+
+    scale = {'tracks_nr': args.tracks, 'artists_nr': args.artists,
+             'users_nr': args.users, 'sessions_nr': args.sessions}
+    results = run_benchmark(
+        scale, args.group_sizes, args.hours, args.repeat, args.seed)
+    with open(args.output, 'w') as results_file:
+        json.dump(results, results_file, indent=2, default=str)
+
+    print(f'preprocess: {results["preprocess"]["seconds"]:.3f} s')
+    print(pd.DataFrame(results['summary']).T.to_string())
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        print()
+        print(compare(results, baseline).to_string(index=False))
+    print(f'\nsaved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
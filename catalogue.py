@@ -0,0 +1,215 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from feature_store import FeatureStore
+from similarity import unit_blocks
+from storage import content_hash, replace_file, save_json
+from user_histories import InteractionMatrix
+
+
+class Catalogue:
+    """
+    numeric arrays of tracks and sessions (durations, unit length
+    dense features and sparse genres, user x track interactions with
+    integer coded ids)
+    saved as .npy files and memory-mapped read-only, so every worker
+    process attaches to the same pages instead of building own copies
+    """
+    directory = 'catalogue'
+    meta_file = 'catalogue.json'
+    genres_arrays = ('genres_indptr', 'genres_indices', 'genres_data',
+                     'genres_t_indptr', 'genres_t_indices', 'genres_t_data')
+    interaction_arrays = ('users', 'indptr', 'indices', 'played', 'skipped',
+                          'liked', 'scaled_played', 'disliked')
+    # weight of genres in similarity, 1 is cosine of all features joined
+    genres_weight = 1.0
+
+    def __init__(self, durations: np.ndarray, unit_features: np.ndarray,
+                 genres_arrays: dict, interaction_arrays: dict, meta: dict):
+        """
+        :param durations: durations of tracks in tracks df order
+        :param unit_features: dense features of tracks divided by norms
+        of all features
+        :param genres_arrays: CSR arrays of genres divided by the norms
+        and of the transposed genres (genre x track)
+        :param interaction_arrays: arrays of the interaction matrix
+        :param meta: ids of tracks and interactions tracks, feature
+        columns, hashes of durations and features and sessions
+        fingerprint used to check if data changed
+        """
+        self.durations = durations
+        self.unit_features = unit_features
+        self.genres_arrays = genres_arrays
+        self.interaction_arrays = interaction_arrays
+        self.meta = meta
+
+    @staticmethod
+    def sessions_fingerprint(sessions_df: pd.DataFrame) -> dict:
+        """
+        method describes sessions by rows number and sum of hashes of
+        their events, so any appended, removed or changed event is noticed
+        """
+        events = sessions_df[['user_id', 'track_id', 'event_type']]
+        hashes = pd.util.hash_pandas_object(events, index=False)
+        return {'rows': len(sessions_df),
+                'hash': str(hashes.to_numpy().sum(dtype=np.uint64))}
+
+    @classmethod
+    def build(cls, tracks_df: pd.DataFrame, sessions_df: pd.DataFrame,
+              feature_store: FeatureStore) -> 'Catalogue':
+        """
+        method builds arrays of the catalogue
+        :param tracks_df: dataframe with tracks
+        :param sessions_df: dataframe with sessions
+        :param feature_store: normalized features of tracks df
+        :return: catalogue kept in memory
+        """
+        interactions = InteractionMatrix.from_sessions(sessions_df)
+        interaction_arrays = {
+            'users': interactions.users.to_numpy(dtype=np.int64),
+            'indptr': interactions.indptr,
+            'indices': interactions.indices,
+            **interactions.data}
+        unit_features, unit_genres = unit_blocks(
+            feature_store.features, feature_store.genres, cls.genres_weight)
+        unit_genres_t = unit_genres.T.tocsr()
+        genres_arrays = {'genres_indptr': unit_genres.indptr,
+                         'genres_indices': unit_genres.indices,
+                         'genres_data': unit_genres.data,
+                         'genres_t_indptr': unit_genres_t.indptr,
+                         'genres_t_indices': unit_genres_t.indices,
+                         'genres_t_data': unit_genres_t.data}
+        meta = {'track_ids': tracks_df['id'].tolist(),
+                'feature_columns': feature_store.feature_columns,
+                'genre_columns': feature_store.genre_columns,
+                'durations_hash': content_hash(tracks_df, ['duration_sec']),
+                'features_hash': feature_store.data_hash,
+                'genres_weight': cls.genres_weight,
+                'unit_genres_columns': unit_genres.shape[1],
+                'interaction_tracks': interactions.tracks.tolist(),
+                'sessions': cls.sessions_fingerprint(sessions_df)}
+        return cls(
+            np.ascontiguousarray(
+                tracks_df['duration_sec'].to_numpy(dtype=np.int64)),
+            unit_features, genres_arrays, interaction_arrays, meta)
+
+    @classmethod
+    def filepath(cls, path: str, name: str) -> str:
+        return os.path.join(path, cls.directory, name)
+
+    def save(self, path: str) -> None:
+        """
+        method saves catalogue to its directory in given directory,
+        files are replaced, not overwritten, because running processes
+        may have memory-mapped them
+        :param path: directory with preprocessed data
+        """
+        def save_array(name, array):
+            replace_file(self.filepath(path, f'{name}.npy'),
+                         lambda filepath: np.save(filepath, array))
+
+        os.makedirs(os.path.join(path, self.directory), exist_ok=True)
+        save_array('durations', self.durations)
+        save_array('unit_features', self.unit_features)
+        for arrays in (self.genres_arrays, self.interaction_arrays):
+            for name in arrays:
+                save_array(name, arrays[name])
+        save_json(self.filepath(path, self.meta_file), self.meta)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = 'r') -> 'Catalogue':
+        """
+        method loads catalogue saved in given directory
+        :param path: directory with preprocessed data
+        :param mmap_mode: memory-map mode of arrays, None loads to memory
+        :return: loaded catalogue
+        """
+        def load_array(name):
+            return np.load(cls.filepath(path, f'{name}.npy'),
+                           mmap_mode=mmap_mode)
+
+        with open(cls.filepath(path, cls.meta_file)) as meta_file:
+            meta = json.load(meta_file)
+        return cls(
+            load_array('durations'), load_array('unit_features'),
+            {name: load_array(name) for name in cls.genres_arrays},
+            {name: load_array(name) for name in cls.interaction_arrays},
+            meta)
+
+    def matches(self, tracks_df: pd.DataFrame, sessions_df: pd.DataFrame,
+                feature_store: FeatureStore) -> bool:
+        """
+        method checks if catalogue was built from given data
+        :return: True if tracks, their durations, features and sessions
+        are the same
+        """
+        return (self.meta['track_ids'] == tracks_df['id'].tolist()
+                and self.meta['feature_columns']
+                == feature_store.feature_columns
+                and self.meta['genre_columns'] == feature_store.genre_columns
+                and self.meta['durations_hash']
+                == content_hash(tracks_df, ['duration_sec'])
+                and self.meta['features_hash'] == feature_store.data_hash
+                and self.meta['genres_weight'] == self.genres_weight
+                and self.meta['sessions']
+                == self.sessions_fingerprint(sessions_df))
+
+    @classmethod
+    def load_or_build(cls, tracks_df: pd.DataFrame,
+                      sessions_df: pd.DataFrame, feature_store: FeatureStore,
+                      path: str) -> 'Catalogue':
+        """
+        method memory-maps catalogue from given directory, or builds
+        and saves it when it is missing or out of date (and then
+        memory-maps the saved files, so the built arrays are not kept)
+        :return: catalogue matching given data
+        """
+        try:
+            catalogue = cls.load(path)
+            if catalogue.matches(tracks_df, sessions_df, feature_store):
+                return catalogue
+        except (OSError, ValueError, KeyError):
+            pass
+        cls.build(tracks_df, sessions_df, feature_store).save(path)
+        return cls.load(path)
+
+    def genres_matrix(self, prefix: str, shape: tuple) -> sp.csr_matrix:
+        arrays = self.genres_arrays
+        return sp.csr_matrix(
+            (arrays[f'{prefix}_data'], arrays[f'{prefix}_indices'],
+             arrays[f'{prefix}_indptr']), shape=shape, copy=False)
+
+    def unit_genres(self) -> sp.csr_matrix:
+        """
+        method creates sparse genres matrix using the catalogue arrays
+        without copying them (with no columns if dense genres are
+        joined to unit features)
+        """
+        return self.genres_matrix(
+            'genres',
+            (len(self.unit_features), self.meta['unit_genres_columns']))
+
+    def unit_genres_t(self) -> sp.csr_matrix:
+        """
+        method creates transposed (genre x track) sparse genres matrix
+        using the catalogue arrays without copying them
+        """
+        return self.genres_matrix(
+            'genres_t',
+            (self.meta['unit_genres_columns'], len(self.unit_features)))
+
+    def interactions(self) -> InteractionMatrix:
+        """
+        method creates interaction matrix using the catalogue arrays
+        without copying them
+        """
+        arrays = self.interaction_arrays
+        data = {name: arrays[name] for name in self.interaction_arrays
+                if name not in ('users', 'indptr', 'indices')}
+        return InteractionMatrix(
+            arrays['users'], self.meta['interaction_tracks'],
+            arrays['indptr'], arrays['indices'], data)
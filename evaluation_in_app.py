@@ -1,141 +1,208 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
 from basic_playlist import BasicPlaylist
 from favourite_songs import FavouriteSongsPlaylist
+from instrumentation import stage, timed
 from recommendation_model import RecommendationModel
+from snapshots import SnapshotCache
+from track_index import TrackIndex
+from user_histories import HistoryCache, InteractionMatrix, get_interactions
 
 
-def get_users_history_after(sessions_after_df, users_id):
-    users_history_after = []
-    for user_id in users_id:
-        user_sessions_df = sessions_after_df.loc[
-            sessions_after_df['user_id'] == user_id]
+def get_track_artists(tracks_df):
+    return dict(zip(tracks_df['id'], tracks_df['id_artist']))
 
-        for idx, row in user_sessions_df.iterrows():
-            if row['event_type'] == 'play':
-                users_history_after.append(row['track_id'])
 
-    return users_history_after
+def get_artist_genres(artists_df):
+    artist_genres = artists_df[['id', 'genres']].explode('genres').dropna()
+    return artist_genres.rename(columns={'id': 'id_artist', 'genres': 'genre'})
 
 
 def count_predicted(users_history_after, playlist):
-    predicted = 0
-
-    for track in playlist:
-        if track in users_history_after:
-            predicted += 1
-
-    return predicted
-
-
-def listenedto_artists_genres(sessions_before_df, tracks_df, artists_df, users_id):
-    listened_artists = []
-    listened_genres = []
-    for user_id in users_id:
-        user_artists = {}
-        user_genres = {}
-        user_sessions_df = sessions_before_df.loc[
-            sessions_before_df['user_id'] == user_id]
-
-        for se_idx, row in user_sessions_df.iterrows():
-            if row['event_type'] == 'play':
-                track_id = row['track_id']
-                tracks = tracks_df.loc[
-                    tracks_df['id'] == track_id]
-                for tr_idx, track in tracks.iterrows():
-                    artist_id = track['id_artist']
-
-                    if artist_id not in user_artists:
-                        user_artists[artist_id] = 0
-                    user_artists[artist_id] += 1
-
-                    artists = artists_df.loc[
-                        artists_df['id'] == artist_id]
-                    for ar_idx, artist in artists.iterrows():
-                        genres = artist['genres']
-                        for genre in genres:
-                            if genre not in user_genres:
-                                user_genres[genre] = 0
-                            user_genres[genre] += 1
-
-        for artist in user_artists.keys():
-            if user_artists[artist] >= 5:
-                listened_artists.append(artist)
-        for genre in user_genres.keys():
-            if user_genres[genre] >= 5:
-                listened_genres.append(genre)
-
-    return listened_artists, listened_genres
-
-
-def count_artists_genres(listened_artists, listened_genres, tracks_df, artists_df, playlist):
-    present_artists = []
-    present_listened_artists = 0
-    present_genres = []
-    present_listened_genres = 0
-    for track_id in playlist:
-        tracks = tracks_df.loc[
-            tracks_df['id'] == track_id]
-        for tr_idx, track in tracks.iterrows():
-            artist_id = track['id_artist']
-
-            if artist_id not in present_artists:
-                present_artists.append(artist_id)
-                present_listened_artists += listened_artists.count(artist_id)
-
-            artists = artists_df.loc[
-                artists_df['id'] == artist_id]
-            for ar_idx, artist in artists.iterrows():
-                genres = artist['genres']
-                for genre in genres:
-                    if genre not in present_genres:
-                        present_genres.append(genre)
-                        present_listened_genres += listened_genres.count(genre)
+    return sum(track in users_history_after for track in playlist)
+
+
+class EvaluationSplit:
+    """
+    sessions split by median timestamp into "before" (used to create
+    playlists) and "after" (used to check them) halves together with
+    per-user profiles, computed once per sessions snapshot:
+    * interaction matrix of sessions after the split (tracks played)
+    * sparse user x artist and user x genre numbers of plays before
+    the split, products of user x track plays with track x artist
+    and artist x genre matrices
+    """
+    min_plays = 5
+
+    def __init__(self, sessions_df, tracks_df, artists_df):
+        self.middle_date = sessions_df['timestamp'].median()
+        before = sessions_df['timestamp'] <= self.middle_date
+        self.sessions_before_df = sessions_df.loc[before]
+        self.sessions_after_df = sessions_df.loc[~before]
+
+        self.track_artists = get_track_artists(tracks_df)
+        self.artist_genres = get_artist_genres(artists_df)
+
+        self.interactions_after = InteractionMatrix.from_sessions(
+            self.sessions_after_df)
+        # shared with histories of playlists created on the "before" half
+        self.interactions_before = get_interactions(self.sessions_before_df)
+
+        tracks = self.interactions_before.tracks
+        artist_of_tracks = pd.Series(tracks).map(self.track_artists)
+        self.artists = pd.Index(artist_of_tracks.dropna().unique())
+        artist_codes = self.artists.get_indexer(artist_of_tracks)
+        tracks_artists = indicator_matrix(
+            np.arange(len(tracks)), artist_codes,
+            (len(tracks), len(self.artists)))
+
+        genre_codes, genres = pd.factorize(self.artist_genres['genre'])
+        self.genres = pd.Index(genres)
+        artists_genres = indicator_matrix(
+            self.artists.get_indexer(self.artist_genres['id_artist']),
+            genre_codes, (len(self.artists), len(self.genres)))
+
+        plays = self.interactions_before.matrices['play']
+        self.users_artist_plays = (plays @ tracks_artists).tocsr()
+        self.users_genre_plays = \
+            (self.users_artist_plays @ artists_genres).tocsr()
+
+    def users_history_after(self, users_id):
+        """
+        method finds tracks played by users after the split
+        :return: set of track ids
+        """
+        return self.interactions_after.played_tracks(users_id)
+
+    def count_listened(self, users_plays, values, users_id):
+        listened = Counter()
+        users_count = Counter(users_id)
+        rows = self.interactions_before.user_rows(list(users_count))
+        for row, user_count in zip(rows, users_count.values()):
+            if row < 0:
+                continue
+            start, end = users_plays.indptr[row], users_plays.indptr[row + 1]
+            columns = users_plays.indices[start:end][
+                users_plays.data[start:end] >= self.min_plays]
+            for value in values[columns]:
+                listened[value] += user_count
+        return listened
+
+    def listenedto_artists_genres(self, users_id):
+        """
+        method counts artists and genres played at least min_plays times
+        before the split by every user (user given twice counts twice)
+        :return: (counter of artists, counter of genres)
+        """
+        return \
+            self.count_listened(self.users_artist_plays, self.artists, users_id), \
+            self.count_listened(self.users_genre_plays, self.genres, users_id)
+
+
+def indicator_matrix(rows, columns, shape):
+    """
+    function creates sparse matrix with ones in given cells,
+    cells given many times are summed and cells with -1 are skipped
+    """
+    known = (rows >= 0) & (columns >= 0)
+    return sp.csr_matrix(
+        (np.ones(known.sum(), dtype=np.int64), (rows[known], columns[known])),
+        shape=shape)
+
+
+_splits = SnapshotCache(EvaluationSplit)
+
+
+def get_evaluation_split(sessions_df, tracks_df, artists_df):
+    """
+    function returns split of given sessions, it is computed only once
+    while the same sessions, tracks and artists dataframes with the same
+    rows counts are used
+    """
+    return _splits.get(sessions_df, tracks_df, artists_df)
+
+
+def count_artists_genres(listened_artists, listened_genres, track_artists, artist_genres, playlist):
+    present_artists = {
+        track_artists[track_id] for track_id in playlist
+        if track_id in track_artists}
+    present_genres = set(artist_genres.loc[
+        artist_genres['id_artist'].isin(present_artists), 'genre'])
+
+    present_listened_artists = sum(
+        listened_artists[artist_id] for artist_id in present_artists)
+    present_listened_genres = sum(
+        listened_genres[genre] for genre in present_genres)
 
     return len(present_artists), present_listened_artists, \
         len(present_genres), present_listened_genres
 
 
-def evaluate(artists_df, tracks_df, sessions_df, users_df, users_id, playlist_duration):
-    middle_date = sessions_df['timestamp'].median()
-
-    sessions_before_df = sessions_df.loc[
-        sessions_df['timestamp'] <= middle_date]
-    sessions_after_df = sessions_df.loc[
-        sessions_df['timestamp'] > middle_date]
-
-    users_history_after = get_users_history_after(sessions_after_df, users_id)
-    listened_artists, listened_genres = listenedto_artists_genres(sessions_before_df, tracks_df, artists_df, users_id)
-
-    basic_playlist = BasicPlaylist(artists_df, sessions_before_df, tracks_df, users_df, users_id, playlist_duration)
+def get_playlist_metrics(users_history_after, listened_artists, listened_genres, track_artists, artist_genres, playlist):
+    predicted = count_predicted(users_history_after, playlist)
+    present_artists, present_listened_artists, \
+        present_genres, present_listened_genres = count_artists_genres(listened_artists, listened_genres, track_artists, artist_genres, playlist)
+
+    return {
+        'predicted': predicted,
+        'playlist_length': len(playlist),
+        'predicted_percent': 100 * predicted/len(playlist),
+        'present_artists': present_artists,
+        'present_listened_artists': present_listened_artists,
+        'artist_indicator': present_listened_artists/present_artists,
+        'present_genres': present_genres,
+        'present_listened_genres': present_listened_genres,
+        'genre_indicator': present_listened_genres/present_genres,
+    }
+
+
+@timed('evaluation.evaluate_models')
+def evaluate_models(artists_df, tracks_df, sessions_df, users_df, users_id, playlist_duration, track_index=None, history_cache=None, similarity=None, feature_store=None, split=None):
+    track_index = track_index or TrackIndex(tracks_df)
+    history_cache = history_cache or HistoryCache()
+    with stage('evaluation.split'):
+        split = split or get_evaluation_split(sessions_df, tracks_df, artists_df)
+    sessions_before_df = split.sessions_before_df
+
+    with stage('evaluation.profiles'):
+        users_history_after = split.users_history_after(users_id)
+        track_artists = split.track_artists
+        artist_genres = split.artist_genres
+        listened_artists, listened_genres = split.listenedto_artists_genres(users_id)
+
+    basic_playlist = BasicPlaylist(artists_df, sessions_before_df, tracks_df, users_df, users_id, playlist_duration, track_index, history_cache)
     created_basic_playlist = basic_playlist.create_full_basic_playlist()
     basic_playlist_list = created_basic_playlist['id'].tolist()
 
-    basic_predicted = count_predicted(users_history_after, basic_playlist_list)
-    basic_percent = 100 * basic_predicted/len(basic_playlist_list)
-    print(f'Basic: Correct predictions - {basic_predicted}/{len(basic_playlist_list)} -> {basic_percent:.2f}%')
-
-    present_artists, present_listened_artists, \
-        present_genres, present_listened_genres = count_artists_genres(listened_artists, listened_genres, tracks_df, artists_df, basic_playlist_list)
-    artist_ind = present_listened_artists/present_artists
-    genre_ind = present_listened_genres/present_genres
-    print(f'Basic: Artist indicator: {present_listened_artists}/{present_artists} -> {artist_ind:.2f}')
-    print(f'Basic: Genre indicator: {present_listened_genres}/{present_genres} -> {genre_ind:.2f}')
-
-    fav_songs_playlist = FavouriteSongsPlaylist(artists_df, sessions_before_df ,tracks_df, users_df, users_id, playlist_duration)
+    fav_songs_playlist = FavouriteSongsPlaylist(artists_df, sessions_before_df ,tracks_df, users_df, users_id, playlist_duration, track_index, history_cache)
     created_first_part_playlist = fav_songs_playlist.create_first_part_playlist()
     first_part_playlist_list = created_first_part_playlist['id'].tolist()
 
-    model_playlist = RecommendationModel(first_part_playlist_list, tracks_df, playlist_duration)
+    model_playlist = RecommendationModel(first_part_playlist_list, tracks_df, playlist_duration, track_index, similarity, feature_store)
     created_model_playlist = model_playlist.create_playlist()
     model_playlist_list = created_model_playlist['id'].tolist()
 
-    model_predicted = count_predicted(users_history_after, model_playlist_list)
-    model_percent = 100 * model_predicted/len(model_playlist_list)
+    with stage('evaluation.metrics'):
+        return {
+            'basic': get_playlist_metrics(users_history_after, listened_artists, listened_genres, track_artists, artist_genres, basic_playlist_list),
+            'model': get_playlist_metrics(users_history_after, listened_artists, listened_genres, track_artists, artist_genres, model_playlist_list),
+        }
 
-    print(f'\nModel: Correct predictions - {model_predicted}/{len(model_playlist_list)} -> {model_percent:.2f}%')
 
-    present_artists, present_listened_artists, \
-        present_genres, present_listened_genres = count_artists_genres(listened_artists, listened_genres, tracks_df, artists_df, model_playlist_list)
-    artist_ind = present_listened_artists/present_artists
-    genre_ind = present_listened_genres/present_genres
-    print(f'Model: Artist indicator: {present_listened_artists}/{present_artists} -> {artist_ind:.2f}')
-    print(f'Model: Genre indicator: {present_listened_genres}/{present_genres} -> {genre_ind:.2f}\n\n')
+def print_metrics(name, metrics):
+    print(f'{name}: Correct predictions - {metrics["predicted"]}/{metrics["playlist_length"]} -> {metrics["predicted_percent"]:.2f}%')
+    print(f'{name}: Artist indicator: {metrics["present_listened_artists"]}/{metrics["present_artists"]} -> {metrics["artist_indicator"]:.2f}')
+    print(f'{name}: Genre indicator: {metrics["present_listened_genres"]}/{metrics["present_genres"]} -> {metrics["genre_indicator"]:.2f}')
+
+
+def evaluate(artists_df, tracks_df, sessions_df, users_df, users_id, playlist_duration, track_index=None, history_cache=None, similarity=None, feature_store=None, split=None):
+    results = evaluate_models(artists_df, tracks_df, sessions_df, users_df, users_id, playlist_duration, track_index, history_cache, similarity, feature_store, split)
+
+    print_metrics('Basic', results['basic'])
+    print()
+    print_metrics('Model', results['model'])
+    print('\n')
@@ -1,33 +1,14 @@
 import pandas as pd
 
+from instrumentation import stage
 from playlist import Playlist
+from user_histories import favourite_histories
 
 
 class FavouriteSongsPlaylist(Playlist):
-
-    @staticmethod
-    def scale_playings(row: pd.Series) -> int:
-        """
-        function scales playings (doubles
-        or triples it due to nunmber of likes)
-        :return: scaled playings
-        """
-        played = row['played']
-        liked = row['liked']
-        if not liked:
-            return played
-        elif liked >= 5:
-            return played*3
-        else:
-            return played*2
-
-    @staticmethod
-    def add_dislikes(row: pd.Series) -> int:
-        """
-        funciton determines if song is disliked by user or not
-        :return: 1 if it is disliked, 0 if not
-        """
-        return 0 if row['skipped'] <= row['played']*0.5 else 1
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.filtered_histories = None
 
     # user history methods
 
@@ -37,38 +18,7 @@ class FavouriteSongsPlaylist(Playlist):
         :user_id: id of the user
         :return: dataframe with history of tracks listened by user
         """
-        user_session_df = self.sessions_df.loc[
-            self.sessions_df['user_id'] == user_id]
-
-        user_history = dict()
-
-        for idx, row in user_session_df.iterrows():
-            track = row['track_id']
-            if track not in user_history:
-                # [play, skip, like]
-                user_history[track] = [0, 0, 0]
-            if row['event_type'] == 'play':
-                event = 0
-            elif row['event_type'] == 'skip':
-                event = 1
-            elif row['event_type'] == 'like':
-                event = 2
-
-            user_history[track][event] += 1
-
-        user_history = pd.DataFrame.from_dict(
-            user_history, orient='index',
-            columns=['played', 'skipped', 'liked'])
-
-        user_history['dislike'] = user_history.apply(
-            lambda row: self.add_dislikes(row), axis=1)
-
-        user_history['played'] = user_history.apply(
-            lambda row: self.scale_playings(row), axis=1)
-
-        user_history.drop(columns=['skipped', 'liked'], inplace=True)
-
-        return user_history
+        return favourite_histories(self.sessions_df, [user_id])[0]
 
     def generate_users_histories(self) -> list:
         """
@@ -76,45 +26,56 @@ class FavouriteSongsPlaylist(Playlist):
         all tracks listened by specified users
         :return: list of track history of every user
         """
-        users_histories = []
-        for user_id in self.users_id:
-            users_histories.append(self.create_user_history(user_id))
-        return users_histories
+        with stage('playlist.histories'):
+            return self.history_cache.get_histories(
+                self.sessions_df, self.users_id, favourite_histories)
 
     # Methods to create first part playlist
 
     @staticmethod
-    def get_disliked_songs(users_histories: list) -> list:
+    def get_disliked_songs(users_histories: list) -> set:
         """
-        method finds disliked songs
+        method finds songs disliked by anyone in the group
         :param users_histories: tracks list of every user
-        :return: list of disliked songs for every user
+        :return: set of disliked songs ids
         """
         disliked_songs = set()
         for user_history in users_histories:
-            for idx, row in user_history.iterrows():
-                if row['dislike']:
-                    disliked_songs.add(idx)
+            disliked_songs.update(
+                user_history.index[user_history['dislike'].to_numpy() == 1])
+        return disliked_songs
 
-        return list(disliked_songs)
-
-    def drop_disliked_songs(self, users_histories: list):
+    def drop_disliked_songs(self, users_histories: list,
+                            disliked_songs: set = None):
         """
         method drops disliked songs in all tracks
         which users know
         :param user_histories: list of dataframes with
         tracks history for every user
-        :disliked_songs: list of all songs that are disliked
-        by anyone above these users
+        :param disliked_songs: songs disliked by anyone in the group,
+        found in histories if None
         """
-        disliked_songs = self.get_disliked_songs(users_histories)
+        if disliked_songs is None:
+            disliked_songs = self.get_disliked_songs(users_histories)
+        disliked_index = pd.Index(list(disliked_songs))
         for user_history in users_histories:
-            songs_to_drop = []
-            for idx, row in user_history.iterrows():
-                if idx in disliked_songs:
-                    songs_to_drop.append(idx)
+            user_history.drop(
+                user_history.index[user_history.index.isin(disliked_index)],
+                inplace=True)
 
-            user_history.drop(songs_to_drop, inplace=True)
+    def get_filtered_histories(self) -> list:
+        """
+        method returns histories of users without songs disliked by
+        anyone in the group, they are filtered once per playlist and
+        reused by every packing attempt
+        :return: list of dataframes with tracks history for every user
+        """
+        if self.filtered_histories is None:
+            users_histories = self.generate_users_histories()
+            with stage('favourite.drop_disliked'):
+                self.drop_disliked_songs(users_histories)
+            self.filtered_histories = users_histories
+        return self.filtered_histories
 
     def get_user_favourites(self,
                             user_history: pd.DataFrame,
@@ -131,32 +92,12 @@ class FavouriteSongsPlaylist(Playlist):
             .index)
         return list(user_favourites)
 
-    def all_users_favourites(self,
-                             users_histories: list,
-                             songs_per_user: int) -> set:
+    def users_candidates(self, songs_per_user: int) -> list:
         """
-        method finds favourite tracks for every user
-        :param user_histories: list of dataframes with
-        tracks history for every user
-        :return: set of all users favourite songs
+        method finds favourite songs of every user
+        excluding tracks disliked by anyone in the group
+        :return: list with list of favourite songs ids of every user
         """
-        all_favourites = []
-        for user_history in users_histories:
-            user_favourites = self.get_user_favourites(
-                user_history, songs_per_user)
-            all_favourites.extend(user_favourites)
-
-        return set(all_favourites)
-
-    def create_playlist_user_history(self, songs_per_user: int) -> list:
-        """
-        method creates playlist based on users favourite songs
-        and excluding disliked tracks
-        :return: list of songs ids
-        """
-        users_histories = self.generate_users_histories()
-        self.drop_disliked_songs(users_histories)
-        basic_playlist = self.all_users_favourites(
-            users_histories, songs_per_user)
-
-        return basic_playlist
+        users_histories = self.get_filtered_histories()
+        return [self.get_user_favourites(user_history, songs_per_user)
+                for user_history in users_histories]
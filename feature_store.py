@@ -0,0 +1,202 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from snapshots import SnapshotCache
+from storage import (content_hash, load_genre_columns, replace_file,
+                     save_json)
+
+
+class FeatureStore:
+    """
+    normalized tracks features built once from tracks df and
+    saved next to preprocessed data, so recommendation models
+    do not refit the scaler for every playlist, features are split
+    into a small dense block (audio features) and a sparse block
+    of one-hot genres, which are mostly zeros
+    """
+    features_file = 'features.npy'
+    genres_file = 'genres.npz'
+    meta_file = 'features.json'
+
+    def __init__(self, features: np.ndarray, genres: sp.csr_matrix,
+                 feature_columns: list,
+                 genre_columns: list, track_ids: list, data_hash: str):
+        """
+        :param features: normalized dense features
+        :param genres: normalized one-hot genres
+        :param feature_columns: all feature columns (genres included)
+        :param genre_columns: columns of the genres block
+        :param track_ids: ids of the tracks of the rows
+        :param data_hash: hash of the tracks features the store was
+        built from
+        """
+        self.features = features
+        self.genres = genres
+        self.feature_columns = feature_columns
+        self.genre_columns = genre_columns
+        self.track_ids = track_ids
+        self.data_hash = data_hash
+
+    @staticmethod
+    def get_feature_columns(tracks_df: pd.DataFrame) -> list:
+        """
+        method get columns which need to be normalized
+        :return: list of column names
+        """
+        col_to_remove = ['id', 'name', 'id_artist']
+        feature_cols = tracks_df.columns.tolist()
+        for col in col_to_remove:
+            feature_cols.remove(col)
+        return feature_cols
+
+    @staticmethod
+    def one_hot_columns(tracks_df: pd.DataFrame) -> list:
+        """
+        method finds one-hot genre columns of tracks by their types:
+        uint8 in preprocessed tracks and sparse ones right after one-hot
+        encoding, used only for tracks without saved genre columns
+        (integer genres of other tracks are scaled like dense features,
+        which gives the same similarities)
+        :return: list of column names
+        """
+        return [column for column in tracks_df.columns
+                if tracks_df[column].dtype == np.uint8
+                or isinstance(tracks_df[column].dtype, pd.SparseDtype)]
+
+    @staticmethod
+    def scale_genres(tracks_df: pd.DataFrame,
+                     genre_columns: list) -> sp.csr_matrix:
+        """
+        method scales one-hot genres like min-max scaler, column by
+        column, so the dense tracks x genres matrix is never created
+        :return: sparse matrix with scaled genres
+        """
+        rows, columns, values = [], [], []
+        for column_nr, genre in enumerate(genre_columns):
+            column = tracks_df[genre].to_numpy(dtype=np.float64)
+            if not len(column):
+                continue
+            low, high = column.min(), column.max()
+            scale = high - low if high > low else 1
+            nonzero = np.flatnonzero(column != low)
+            rows.append(nonzero)
+            columns.append(np.full(len(nonzero), column_nr))
+            values.append((column[nonzero] - low) / scale)
+        shape = (len(tracks_df), len(genre_columns))
+        if not rows:
+            return sp.csr_matrix(shape, dtype=np.float32)
+        return sp.csr_matrix(
+            (np.concatenate(values).astype(np.float32),
+             (np.concatenate(rows), np.concatenate(columns))), shape=shape)
+
+    @classmethod
+    def build(cls, tracks_df: pd.DataFrame,
+              genre_columns: list) -> 'FeatureStore':
+        """
+        method normalizes features of all tracks
+        :param tracks_df: dataframe with tracks
+        :param genre_columns: one-hot genre columns made by preprocessing
+        :return: feature store with float32 dense features and sparse
+        genres
+        """
+        # imported here, the app only loads saved features
+        from sklearn.preprocessing import MinMaxScaler
+
+        feature_cols = cls.get_feature_columns(tracks_df)
+        genre_cols = [column for column in genre_columns
+                      if column in feature_cols]
+        dense_cols = [column for column in feature_cols
+                      if column not in genre_cols]
+        scaler = MinMaxScaler()
+        features = scaler.fit_transform(
+            tracks_df[dense_cols].to_numpy(dtype=np.float64))
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        genres = cls.scale_genres(tracks_df, genre_cols)
+        return cls(features, genres, feature_cols, genre_cols,
+                   tracks_df['id'].tolist(),
+                   content_hash(tracks_df, feature_cols))
+
+    def save(self, path: str) -> None:
+        """
+        method saves feature store to given directory, files are
+        replaced, not overwritten, because running processes may
+        have memory-mapped them
+        :param path: directory with preprocessed data
+        """
+        replace_file(os.path.join(path, self.features_file),
+                     lambda filepath: np.save(filepath, self.features))
+        replace_file(os.path.join(path, self.genres_file),
+                     lambda filepath: sp.save_npz(filepath, self.genres,
+                                                  compressed=False))
+        save_json(os.path.join(path, self.meta_file),
+                  {'feature_columns': self.feature_columns,
+                   'genre_columns': self.genre_columns,
+                   'track_ids': self.track_ids,
+                   'data_hash': self.data_hash})
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = 'r') -> 'FeatureStore':
+        """
+        method loads feature store saved in given directory
+        :param path: directory with preprocessed data
+        :param mmap_mode: memory-map mode of features, None loads to memory
+        :return: loaded feature store
+        """
+        features = np.load(
+            os.path.join(path, cls.features_file), mmap_mode=mmap_mode)
+        genres = sp.load_npz(os.path.join(path, cls.genres_file)).tocsr()
+        with open(os.path.join(path, cls.meta_file)) as meta_file:
+            meta = json.load(meta_file)
+        return cls(features, genres, meta['feature_columns'],
+                   meta['genre_columns'], meta['track_ids'],
+                   meta['data_hash'])
+
+    def matches(self, tracks_df: pd.DataFrame, genre_columns: list) -> bool:
+        """
+        method checks if store was built from given tracks
+        :return: True if tracks, feature and genre columns and values
+        of features are the same
+        """
+        feature_cols = self.get_feature_columns(tracks_df)
+        return (self.track_ids == tracks_df['id'].tolist()
+                and self.feature_columns == feature_cols
+                and self.genre_columns
+                == [column for column in genre_columns
+                    if column in feature_cols]
+                and self.data_hash == content_hash(tracks_df, feature_cols))
+
+    @classmethod
+    def load_or_build(cls, tracks_df: pd.DataFrame,
+                      path: str) -> 'FeatureStore':
+        """
+        method loads feature store from given directory, or builds
+        and saves it when it is missing or out of date
+        :return: feature store matching tracks df
+        """
+        genre_columns = load_genre_columns(path)
+        try:
+            feature_store = cls.load(path)
+            if feature_store.matches(tracks_df, genre_columns):
+                return feature_store
+        except (OSError, ValueError, KeyError):
+            pass
+        feature_store = cls.build(tracks_df, genre_columns)
+        feature_store.save(path)
+        return feature_store
+
+
+_feature_stores = SnapshotCache(
+    lambda tracks_df: FeatureStore.build(
+        tracks_df, FeatureStore.one_hot_columns(tracks_df)))
+
+
+def get_feature_store(tracks_df: pd.DataFrame) -> FeatureStore:
+    """
+    function returns feature store of tracks kept in memory, it is
+    built only once while the same tracks dataframe is used
+    """
+    return _feature_stores.get(tracks_df)
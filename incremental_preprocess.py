@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+
+from preprocess import Preprocess, read_jsonl_chunks
+from storage import PREPROCESSED_PATH, append_df, load_df
+
+
+class IncrementalPreprocess:
+    """
+    preprocessing which ingests only session lines appended since the
+    last run, full preprocessing is done only when artists, tracks
+    or users files have changed (or sessions file was rewritten)
+    """
+    checkpoint_path = os.path.join(PREPROCESSED_PATH, 'checkpoint.json')
+    tail_size = 4096
+
+    def __init__(self, path_to_artists, path_to_sessions,
+                 path_to_tracks, path_to_users, file_format='parquet',
+                 sessions_chunksize: int = 100000):
+        self.path_to_artists = path_to_artists
+        self.path_to_sessions = path_to_sessions
+        self.path_to_tracks = path_to_tracks
+        self.path_to_users = path_to_users
+        self.file_format = file_format
+        self.sessions_chunksize = sessions_chunksize
+
+# Checkpoint methods
+
+    @staticmethod
+    def file_hash(filepath: str, size: int = None, start: int = 0) -> str:
+        """
+        function calculates sha256 hash of the file content
+        :param filepath: path to the file
+        :param size: number of bytes to hash, whole file if None
+        :param start: byte offset where hashing starts
+        :return: hex digest of the content
+        """
+        file_hash = hashlib.sha256()
+        with open(filepath, 'rb') as file:
+            file.seek(start)
+            remaining = size
+            while remaining is None or remaining > 0:
+                block_size = 1 << 20 if remaining is None \
+                    else min(1 << 20, remaining)
+                block = file.read(block_size)
+                if not block:
+                    break
+                file_hash.update(block)
+                if remaining is not None:
+                    remaining -= len(block)
+        return file_hash.hexdigest()
+
+    def catalogue_hashes(self) -> dict:
+        """
+        method calculates hashes of artists, tracks and users files
+        :return: dict with hash of every file
+        """
+        return {
+            'artists': self.file_hash(self.path_to_artists),
+            'tracks': self.file_hash(self.path_to_tracks),
+            'users': self.file_hash(self.path_to_users)}
+
+    def sessions_tail_hash(self, offset: int) -> str:
+        """
+        method calculates hash of the last ingested bytes of sessions,
+        used to check that the file was only appended
+        :param offset: number of ingested bytes
+        :return: hex digest of the bytes before offset
+        """
+        start = max(offset - self.tail_size, 0)
+        return self.file_hash(self.path_to_sessions, offset - start, start)
+
+    def load_checkpoint(self) -> dict:
+        """
+        method loads checkpoint of the last preprocessing
+        :return: checkpoint dict or None if there is no checkpoint
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path) as checkpoint_file:
+            return json.load(checkpoint_file)
+
+    def save_checkpoint(self, hashes: dict, offset: int) -> None:
+        """
+        method saves checkpoint of preprocessed data
+        :param hashes: hashes of artists, tracks and users files
+        :param offset: number of ingested bytes of sessions file
+        """
+        checkpoint = {
+            'hashes': hashes,
+            'sessions_offset': offset,
+            'sessions_tail_hash': self.sessions_tail_hash(offset),
+            'file_format': self.file_format}
+        with open(self.checkpoint_path, 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+
+    def is_stale(self, checkpoint: dict, hashes: dict) -> bool:
+        """
+        method checks if all data has to be preprocessed again
+        :return: True if catalogue files changed or sessions file
+        is not the ingested file with appended lines
+        """
+        if checkpoint is None or checkpoint['hashes'] != hashes:
+            return True
+        if checkpoint['file_format'] != self.file_format:
+            return True
+        offset = checkpoint['sessions_offset']
+        if os.path.getsize(self.path_to_sessions) < offset:
+            return True
+        return self.sessions_tail_hash(offset) \
+            != checkpoint['sessions_tail_hash']
+
+# Preprocessing
+
+    def preprocess_all(self, hashes: dict) -> dict:
+        """
+        method preprocesses all data from scratch
+        :return: summary of the run
+        """
+        offset = os.path.getsize(self.path_to_sessions)
+        data = Preprocess(self.path_to_artists, self.path_to_sessions,
+                          self.path_to_tracks, self.path_to_users,
+                          self.sessions_chunksize)
+        data.preprocess(self.file_format)
+        if data.sessions_offset is not None:
+            offset = data.sessions_offset
+        self.save_checkpoint(hashes, offset)
+        sessions = len(load_df('sessions', columns=['user_id']))
+        return {'mode': 'full', 'sessions': sessions}
+
+    def preprocess_new_sessions(self, checkpoint: dict) -> dict:
+        """
+        method appends sessions added since checkpoint to preprocessed
+        sessions, reading them in chunks and saving checkpoint
+        after every chunk
+        :return: summary of the run
+        """
+        new_sessions = 0
+        chunks = read_jsonl_chunks(
+            self.path_to_sessions, self.sessions_chunksize,
+            checkpoint['sessions_offset'])
+        for new_sessions_df, offset in chunks:
+            new_sessions_df = Preprocess.compact_sessions(
+                Preprocess.clean_sessions(new_sessions_df))
+            append_df(new_sessions_df, 'sessions')
+            new_sessions += len(new_sessions_df)
+            self.save_checkpoint(checkpoint['hashes'], offset)
+        return {'mode': 'incremental', 'sessions': new_sessions}
+
+    def preprocess(self) -> dict:
+        """
+        main method which preprocesses only new sessions
+        or everything when the saved data is stale
+        :return: summary of the run (mode and number of sessions)
+        """
+        checkpoint = self.load_checkpoint()
+        hashes = self.catalogue_hashes()
+        if self.is_stale(checkpoint, hashes):
+            return self.preprocess_all(hashes)
+        return self.preprocess_new_sessions(checkpoint)
@@ -0,0 +1,156 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+
+class Instrumentation:
+    """
+    registry of stage durations, counters and sizes recorded in the
+    playlist pipeline, disabled by default: then stage() returns
+    a shared empty context and counters return at once, so the
+    instrumented code runs almost as fast as without it
+    """
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._events = []
+        self._lock = threading.Lock()
+        self._null_stage = contextlib.nullcontext()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        """
+        method removes all recorded events
+        """
+        with self._lock:
+            self._events = []
+
+    def _add_event(self, kind: str, name: str, value) -> None:
+        event = {'kind': kind, 'name': name, 'value': value,
+                 'time': time.time(), 'process': os.getpid(),
+                 'thread': threading.get_ident()}
+        with self._lock:
+            self._events.append(event)
+
+    @contextlib.contextmanager
+    def _stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add_event('stage', name, time.perf_counter() - start)
+
+    def stage(self, name: str):
+        """
+        method returns context manager which records duration of the stage
+        :param name: name of the stage
+        """
+        if not self.enabled:
+            return self._null_stage
+        return self._stage(name)
+
+    def timed(self, name: str):
+        """
+        method returns decorator which records duration of every call
+        :param name: name of the stage
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self._stage(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        method adds value to the counter (like number of loop iterations)
+        """
+        if self.enabled:
+            self._add_event('counter', name, value)
+
+    def observe(self, name: str, size: int) -> None:
+        """
+        method records observed size (like number of candidates)
+        """
+        if self.enabled:
+            self._add_event('size', name, size)
+
+    def add_events(self, events: list) -> None:
+        """
+        method adds events recorded elsewhere (like in worker processes)
+        """
+        with self._lock:
+            self._events.extend(events)
+
+    def events(self) -> list:
+        """
+        :return: copy of recorded events in order of recording
+        """
+        with self._lock:
+            return list(self._events)
+
+    def summary(self) -> dict:
+        """
+        method aggregates recorded events
+        :return: dict with stats of stages (calls, total, mean and max
+        seconds), totals of counters and stats of sizes
+        """
+        stages, counters, sizes = dict(), dict(), dict()
+        for event in self.events():
+            name, value = event['name'], event['value']
+            if event['kind'] == 'counter':
+                counters[name] = counters.get(name, 0) + value
+                continue
+            stats = (stages if event['kind'] == 'stage' else sizes) \
+                .setdefault(name, {'calls': 0, 'total': 0, 'max': value})
+            stats['calls'] += 1
+            stats['total'] += value
+            stats['max'] = max(stats['max'], value)
+
+        for stats in list(stages.values()) + list(sizes.values()):
+            stats['mean'] = stats['total'] / stats['calls']
+        return {'stages': stages, 'counters': counters, 'sizes': sizes}
+
+    def report(self) -> str:
+        """
+        method formats summary as readable text
+        """
+        summary = self.summary()
+        lines = ['stage                          calls    total s     max s']
+        for name, stats in summary['stages'].items():
+            lines.append(f'{name:<30} {stats["calls"]:>5} '
+                         f'{stats["total"]:>10.4f} {stats["max"]:>9.4f}')
+        for name, total in summary['counters'].items():
+            lines.append(f'{name:<30} {total:>5}')
+        for name, stats in summary['sizes'].items():
+            lines.append(f'{name:<30} {stats["calls"]:>5} '
+                         f'mean {stats["mean"]:.1f} max {stats["max"]}')
+        return '\n'.join(lines)
+
+    def export(self, filepath: str) -> None:
+        """
+        method saves recorded events as json lines (structured logs)
+        """
+        with open(filepath, 'w') as events_file:
+            for event in self.events():
+                events_file.write(json.dumps(event) + '\n')
+
+
+# registry used by the whole app, enabled with PLAYLIST_INSTRUMENTATION=1
+instrumentation = Instrumentation(
+    os.environ.get('PLAYLIST_INSTRUMENTATION', '') not in ('', '0'))
+
+stage = instrumentation.stage
+timed = instrumentation.timed
+count = instrumentation.count
+observe = instrumentation.observe
@@ -0,0 +1,145 @@
+import time
+
+import numpy as np
+
+
+# maximal size of the knapsack choice table (candidates x gap seconds)
+MAX_KNAPSACK_CELLS = 20_000_000
+
+
+class PackingResult:
+    """
+    result of packing songs into a playlist of given duration
+    """
+    def __init__(self, songs: list, duration: int, target: int,
+                 tolerance: int, iterations: int):
+        self.songs = songs
+        self.duration = duration
+        self.target = target
+        self.tolerance = tolerance
+        self.iterations = iterations
+
+    @property
+    def deviation(self) -> int:
+        """
+        :return: difference between playlist duration and target in seconds
+        """
+        return self.duration - self.target
+
+    @property
+    def within_tolerance(self) -> bool:
+        """
+        :return: True if playlist duration is in the allowed range
+        """
+        return abs(self.deviation) <= self.tolerance
+
+    def __repr__(self) -> str:
+        return (f'PackingResult(songs={len(self.songs)}, '
+                f'duration={self.duration}, target={self.target}, '
+                f'deviation={self.deviation}, '
+                f'within_tolerance={self.within_tolerance}, '
+                f'iterations={self.iterations})')
+
+
+def fill_gap(durations: np.ndarray, scores: np.ndarray,
+             min_gap: int, max_gap: int, target_gap: int,
+             max_iterations: int, deadline: float) -> tuple:
+    """
+    function solves bounded 0/1 knapsack over candidate durations:
+    finds songs which fill the gap with the highest total score
+    :param durations: durations of candidates in seconds
+    :param scores: relevance of candidates
+    :param min_gap: minimal duration which fills the gap
+    :param max_gap: maximal duration which fills the gap
+    :param target_gap: preferred duration if the gap cannot be filled
+    :param max_iterations: maximal number of candidates to process
+    :param deadline: time after which no more candidates are processed
+    :return: positions of chosen candidates and number of iterations
+    """
+    max_candidates = max(1, MAX_KNAPSACK_CELLS // (max_gap + 1))
+    durations = durations[:max_candidates]
+    best = np.full(max_gap + 1, -np.inf)
+    best[0] = 0
+    keep = np.zeros((len(durations), max_gap + 1), dtype=bool)
+
+    iterations = 0
+    for position, (duration, score) in enumerate(zip(durations, scores)):
+        if iterations >= max_iterations or time.monotonic() > deadline:
+            break
+        iterations += 1
+        if duration > max_gap:
+            continue
+        with_song = best[:max_gap + 1 - duration] + score
+        better = with_song > best[duration:]
+        best[duration:][better] = with_song[better]
+        keep[position, duration:] = better
+
+    reachable = np.flatnonzero(np.isfinite(best))
+    in_gap = reachable[(reachable >= min_gap) & (reachable <= max_gap)]
+    if len(in_gap):
+        gap = in_gap[np.argmax(best[in_gap])]
+    else:
+        gap = reachable[np.argmin(np.abs(reachable - target_gap))]
+
+    chosen = []
+    for position in range(iterations - 1, -1, -1):
+        if keep[position, gap]:
+            chosen.append(position)
+            gap -= durations[position]
+    return chosen[::-1], iterations
+
+
+def pack_playlist(candidates: list, durations: np.ndarray, target: int,
+                  tolerance: int, required_duration: int = 0,
+                  scores: np.ndarray = None, max_iterations: int = 5000,
+                  time_budget: float = 1.0) -> PackingResult:
+    """
+    function deterministically chooses songs from candidates so the
+    playlist duration is within target +/- tolerance:
+    * takes candidates in relevance order while they fit in the range
+    * if the playlist is still too short, chooses the best scored subset
+      of all candidates filling the range instead (bounded knapsack),
+      unless it is further from the target
+    :param candidates: ids of songs ordered from the most relevant
+    :param durations: durations of candidates in seconds
+    :param target: wanted playlist duration in seconds
+    :param tolerance: allowed deviation from target in seconds
+    :param required_duration: duration of songs already in the playlist
+    :param scores: relevance of candidates, decreasing with order if None
+    :param max_iterations: maximal number of candidates processed
+    by every pass
+    :param time_budget: maximal time of packing in seconds
+    :return: packing result with chosen songs (without required ones)
+    """
+    deadline = time.monotonic() + time_budget
+    durations = np.asarray(durations, dtype=np.int64)
+    if scores is None:
+        scores = np.linspace(1, 0, len(candidates), endpoint=False)
+
+    total = required_duration
+    chosen = []
+    iterations = 0
+    for position, duration in enumerate(durations):
+        if total >= target or iterations >= max_iterations:
+            break
+        iterations += 1
+        if total + duration <= target + tolerance:
+            chosen.append(position)
+            total += duration
+
+    if total < target - tolerance and len(durations):
+        # a skipped song is longer than the gap left by the greedy
+        # pass, so the whole range is filled again from all candidates
+        knapsack, knapsack_iterations = fill_gap(
+            durations, scores,
+            min_gap=target - tolerance - required_duration,
+            max_gap=target + tolerance - required_duration,
+            target_gap=target - required_duration,
+            max_iterations=max_iterations, deadline=deadline)
+        iterations += knapsack_iterations
+        knapsack_total = required_duration + int(durations[knapsack].sum())
+        if abs(knapsack_total - target) < abs(total - target):
+            chosen, total = knapsack, knapsack_total
+
+    songs = [candidates[position] for position in chosen]
+    return PackingResult(songs, int(total), target, tolerance, iterations)
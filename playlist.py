@@ -1,22 +1,33 @@
 import pandas as pd
-import random
 
 from abc import ABC, abstractmethod
 
+from instrumentation import count, observe, stage, timed
+from packing import PackingResult, pack_playlist
+from track_index import TrackIndex
+from user_histories import HistoryCache
+
 
 class Playlist(ABC):
+    packing_attempts = 3
+
     def __init__(self, artists_df: pd.DataFrame, sesisons_df: pd.DataFrame,
                  tracks_df: pd.DataFrame, users_df: pd.DataFrame,
-                 users_id: list, playlist_duration: tuple):
+                 users_id: list, playlist_duration: tuple,
+                 track_index: TrackIndex = None,
+                 history_cache: HistoryCache = None):
         self.artists_df = artists_df
         self.sessions_df = sesisons_df
         self.tracks_df = tracks_df
         self.users_df = users_df
         self.users_id = users_id
+        self.track_index = track_index or TrackIndex(tracks_df)
+        self.history_cache = history_cache or HistoryCache()
         hours, minutes = playlist_duration
         self.playlist_duration = hours*60*60 + minutes*60
         self.median_song_duration = tracks_df['duration_sec'].median()
         self.time_per_user = self.calculate_time_per_user()
+        self.packing = None
 
 # Time methods
 
@@ -40,14 +51,33 @@ class Playlist(ABC):
 # Create dataframes with users tracks history
 
     @abstractmethod
-    def create_playlist_user_history(self, songs_per_user: int) -> list:
+    def users_candidates(self, songs_per_user: int) -> list:
         """
-        method creates playlist based on users history
-        :return: list of songs ids
+        method finds songs which could be added for every user
+        :return: list with list of songs ids of every user,
+        from the most relevant
         """
         pass
 
-# Checking time and adding more songs if that's needed or dropping
+    def rank_candidates(self, songs_per_user: int) -> list:
+        """
+        method joins candidates of all users taking them in turns
+        (first songs of every user, then second songs...) so the
+        best songs of every user are at the beginning
+        :return: list of unique songs ids ordered by relevance
+        """
+        with stage('playlist.users_candidates'):
+            users_candidates = self.users_candidates(songs_per_user)
+        with stage('playlist.rank_candidates'):
+            candidates = dict()
+            for rank in range(max(map(len, users_candidates), default=0)):
+                for user_candidates in users_candidates:
+                    if rank < len(user_candidates):
+                        candidates.setdefault(user_candidates[rank])
+        observe('playlist.candidates', len(candidates))
+        return list(candidates)
+
+# Checking time and packing songs into the playlist
 
     def count_duration(self, songs_list: list):
         """
@@ -55,69 +85,71 @@ class Playlist(ABC):
         :songs_list: list of the songs to count time
         :return: duration of all these songs
         """
-        total_time = 0
-        for song in songs_list:
-            song_time = int(self.tracks_df.loc[
-                self.tracks_df['id'] == song]['duration_sec'])
-            total_time += song_time
-
-        return total_time
+        count('playlist.count_duration_calls')
+        return self.track_index.count_duration(songs_list)
 
-    def create_first_part_playlist(self) -> pd.DataFrame:
+    def pack_songs(self, candidates: list, target: int, tolerance: int,
+                   required_duration: int = 0) -> PackingResult:
         """
-        super complicated
-        at first: tries to by add the same amount of song fore very user and
-        checks if the time is between 50%-70% of all playlist time
-        if it cannot be done: pops random songs from too long playlist
-        or adds random songs most liked by all users
+        method chooses songs from candidates to fill given time
+        :param candidates: songs ids ordered by relevance
+        :param target: wanted duration in seconds
+        :param tolerance: allowed deviation in seconds
+        :param required_duration: duration of songs already chosen
+        :return: packing result, also saved in self.packing
         """
-        songs_per_user = self.calculate_songs_per_user(0)
-        basic_playlist = self.create_playlist_user_history(songs_per_user)
-
-        perfect_duration = self.playlist_duration * 0.6
-        basic_playlist_duration = self.count_duration(basic_playlist)
-
-        correction = 0
-        adding = 0
-        subtracting = 0
-
-        while basic_playlist_duration > perfect_duration * 1.1 or basic_playlist_duration < perfect_duration * 0.9:
-            if basic_playlist_duration < perfect_duration:
-                correction += 1
-                adding += 1
-                recent_added = True
-            else:
-                correction -= 1
-                subtracting += 1
-                recent_added = False
-
-            songs_per_user = self.calculate_songs_per_user(correction)
-            basic_playlist = self.create_playlist_user_history(songs_per_user)
-
-            basic_playlist_duration = self.count_duration(basic_playlist)
-
-            if adding != 0 and subtracting != 0:
-                if recent_added:
-
-                    while basic_playlist_duration > perfect_duration * 1.1:
-                        basic_playlist.pop()
-                        basic_playlist_duration = self.count_duration(
-                            basic_playlist)
-                else:
-                    extra_playlist = []
-
-                    while basic_playlist_duration < perfect_duration * 0.9:
-                        while (len(extra_playlist) == 0):
-                            extra_playlist = set(
-                                self.create_playlist_user_history(
-                                    songs_per_user+1))
-                            basic_playlist = set(basic_playlist)
-                            extra_songs = list(extra_playlist.difference(
-                                basic_playlist))
-
-                        basic_playlist.add(random.choice(extra_songs))
-
-                        basic_playlist_duration = self.count_duration(
-                            basic_playlist)
+        with stage('playlist.packing'):
+            self.packing = pack_playlist(
+                candidates, self.track_index.get_durations(candidates),
+                target, tolerance, required_duration)
+        count('playlist.packing_iterations', self.packing.iterations)
+        return self.packing
+
+    def pack_first_part(self, candidates: list) -> PackingResult:
+        """
+        method chooses the most relevant candidates so the time is
+        between 54%-66% of all playlist time (60% +/- 10% of it)
+        :param candidates: songs ids ordered by relevance
+        :return: packing result, also saved in self.packing
+        """
+        perfect_duration = int(self.playlist_duration * 0.6)
+        tolerance = int(perfect_duration * 0.1)
+        return self.pack_songs(candidates, perfect_duration, tolerance)
 
-        return self.tracks_df.loc[self.tracks_df['id'].isin(basic_playlist)]
+    def first_part_candidates(self) -> list:
+        """
+        method takes twice as many songs per user as estimated from
+        median song duration, if they are too few to fill the first
+        part more songs of every user are taken, at most a few times
+        :return: candidates used in the last packing (saved in self.packing)
+        """
+        songs_per_user = self.calculate_songs_per_user(0) * 2
+        for _ in range(self.packing_attempts):
+            count('playlist.correction_iterations')
+            candidates = self.rank_candidates(songs_per_user)
+            packing = self.pack_first_part(candidates)
+            if packing.deviation >= -packing.tolerance:
+                break
+            songs_per_user *= 2
+        return candidates
+
+    @timed('playlist.first_part_playlist')
+    def create_first_part_playlist(self, candidates: list = None) \
+            -> pd.DataFrame:
+        """
+        creates part of playlist from songs known by users:
+        chooses the most relevant candidates so the time is
+        between 54%-66% of all playlist time (60% +/- 10% of it)
+        if it cannot be done self.packing tells how far from the
+        target the playlist is
+        :param candidates: songs ids ordered by relevance (like cached
+        ones), if None they are found in users histories
+        """
+        if candidates is None:
+            self.first_part_candidates()
+        else:
+            self.pack_first_part(candidates)
+
+        with stage('playlist.filter_tracks'):
+            return self.tracks_df.loc[
+                self.tracks_df['id'].isin(self.packing.songs)]
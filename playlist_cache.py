@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CandidatePool:
+    """
+    candidates of a group computed for the longest duration of the
+    bucket, so any shorter playlist can be packed from them (only for
+    deterministic candidates, random ones are drawn for every request):
+    * favourites - songs known by users ordered by relevance
+    * recommendations - ranked songs positions for every favourite song
+    and depth of these rankings
+    """
+    def __init__(self, favourites: list, recommendations: dict = None,
+                 depth: int = 0):
+        self.favourites = favourites
+        self.recommendations = recommendations
+        self.depth = depth
+        self.created = time.monotonic()
+
+
+class PlaylistCache:
+    """
+    size-bounded LRU cache of groups candidate pools keyed by
+    (playlist type, sorted users ids, duration bucket),
+    pools older than ttl seconds are built again, pools which were being
+    built while the cache was invalidated are not stored
+    """
+    def __init__(self, max_size: int = 256, ttl: float = 600,
+                 bucket_minutes: int = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.bucket_minutes = bucket_minutes
+        self.hits = 0
+        self.misses = 0
+        self._pools = OrderedDict()
+        # changed by every invalidation
+        self._generation = 0
+        self._lock = threading.RLock()
+
+    def bucket(self, playlist_duration: tuple) -> int:
+        """
+        :return: number of duration bucket of (hours, minutes) duration
+        """
+        hours, minutes = playlist_duration
+        return (hours * 60 + minutes) // self.bucket_minutes
+
+    def bucket_duration(self, bucket: int) -> tuple:
+        """
+        :return: the longest (hours, minutes) duration in the bucket
+        """
+        return divmod((bucket + 1) * self.bucket_minutes - 1, 60)
+
+    def key(self, playlist_type: str, users_id: list,
+            playlist_duration: tuple) -> tuple:
+        return (playlist_type, tuple(sorted(set(users_id))),
+                self.bucket(playlist_duration))
+
+    def get_pool(self, playlist_type: str, users_id: list,
+                 playlist_duration: tuple, build) -> CandidatePool:
+        """
+        method returns pool of the group, missing or expired pool
+        is built for the longest duration of the bucket
+        :param playlist_type: type of the playlist (like model)
+        :param users_id: ids of users
+        :param playlist_duration: (hours, minutes) duration
+        :param build: function building pool from (users_id, duration)
+        :return: candidate pool
+        """
+        key = self.key(playlist_type, users_id, playlist_duration)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is not None \
+                    and time.monotonic() - pool.created <= self.ttl:
+                self.hits += 1
+                self._pools.move_to_end(key)
+                return pool
+            self.misses += 1
+            generation = self._generation
+
+        # built without lock, so other groups are served meanwhile
+        pool = build(users_id, self.bucket_duration(key[2]))
+        with self._lock:
+            if generation != self._generation:
+                # built from sessions older than the invalidation
+                return pool
+            self._pools[key] = pool
+            self._pools.move_to_end(key)
+            while len(self._pools) > self.max_size:
+                self._pools.popitem(last=False)
+        return pool
+
+    def invalidate(self, users_id: list = None) -> None:
+        """
+        method removes pools of groups with any of given users,
+        all pools if no users are given
+        :param users_id: ids of users who have new sessions
+        """
+        with self._lock:
+            self._generation += 1
+            if users_id is None:
+                self._pools.clear()
+                return
+            users = set(users_id)
+            for key in list(self._pools):
+                if users.intersection(key[1]):
+                    del self._pools[key]
+
+    def stats(self) -> dict:
+        """
+        method returns cache counters
+        :return: dict with hits, misses, hit ratio and size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'size': len(self._pools),
+                'max_size': self.max_size}
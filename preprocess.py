@@ -1,137 +1,208 @@
-from sklearn.preprocessing import MultiLabelBinarizer
+import io
+import json
 
 import pandas as pd
-import string
+
+from feature_store import FeatureStore
+from storage import (PREPROCESSED_PATH, append_df, compact_df, load_df,
+                     save_df, save_genre_columns)
+
+
+def is_json(line: bytes) -> bool:
+    try:
+        json.loads(line)
+    except ValueError:
+        return False
+    return True
+
+
+def read_jsonl_chunks(filepath: str, chunksize: int, offset: int = 0):
+    """
+    function reads json lines file in chunks of bounded size, the last
+    line without new line is read only if it is a complete json object,
+    a line which is still being written is left for the next reading
+    :param filepath: path to json lines file
+    :param chunksize: maximal number of lines in a chunk
+    :param offset: byte offset where reading starts
+    :return: generator of (dataframe with chunk, offset after the chunk)
+    """
+    with open(filepath, 'rb') as file:
+        file.seek(offset)
+        lines = []
+        for line in file:
+            if not line.endswith(b'\n') and not is_json(line):
+                break
+            offset += len(line)
+            if line.strip():
+                lines.append(line)
+            if len(lines) == chunksize:
+                yield pd.read_json(io.BytesIO(b''.join(lines)), lines=True), \
+                    offset
+                lines = []
+        if lines:
+            yield pd.read_json(io.BytesIO(b''.join(lines)), lines=True), \
+                offset
 
 
 class Preprocess:
     def __init__(self, path_to_artists, path_to_sessions,
-                 path_to_tracks, path_to_users):
+                 path_to_tracks, path_to_users,
+                 sessions_chunksize: int = None):
+        self.path_to_sessions = path_to_sessions
+        self.sessions_chunksize = sessions_chunksize
+        self.sessions_offset = None
         self.artists_df = pd.read_json(path_to_artists, lines=True)
-        self.session_df = pd.read_json(path_to_sessions, lines=True)
+        self.session_df = None if sessions_chunksize \
+            else pd.read_json(path_to_sessions, lines=True)
         self.tracks_df = pd.read_json(path_to_tracks, lines=True)
         self.users_df = pd.read_json(path_to_users, lines=True)
+        self.genre_columns = []
 
 # Genres preprocessing
 
     @staticmethod
-    def __simplify_genres(row: pd.Series, column_name: string) -> list:
+    def simplify_genre(genre: str) -> str:
         """
-        function simplifies genres by joining the many music styles to one
+        function simplifies genre by joining the many music styles to one
         like pop dance, canadian pop -> pop
-        :param row: row from dataframe
-        :column_name: name of the column
-        "return: list of simplified genres
-        """
-        new_genres = set()
-        for genre in row[column_name]:
-            if genre == 'pop rock' or genre == 'hard rock':
-                new_genres.add(genre)
-            elif 'alternative' in genre:
-                new_genres.add('alternative')
-            elif 'bollywood' in genre:
-                new_genres.add('bollywood')
-            elif 'country' in genre:
-                new_genres.add('country')
-            elif 'dancehall' in genre:
-                new_genres.add('dancehall')
-            elif 'disco' in genre:
-                new_genres.add('disco')
-            elif 'electro' in genre:
-                new_genres.add('electro')
-            elif 'electropop' in genre:
-                new_genres.add('electro')
-            elif 'edm' in genre:
-                new_genres.add('edm')
-            elif 'folk' in genre:
-                new_genres.add('folk')
-            elif 'hip hop' in genre:
-                new_genres.add('hip hop')
-            elif 'house' in genre:
-                new_genres.add('house')
-            elif 'indie' in genre:
-                new_genres.add('indie')
-            elif 'jazz' in genre:
-                new_genres.add('jazz')
-            elif 'k-pop' in genre:
-                new_genres.add('k-pop')
-            elif 'latin' in genre:
-                new_genres.add('latin')
-            elif 'metal' in genre:
-                new_genres.add('metal')
-            elif 'orchestra' in genre:
-                new_genres.add('orchestra')
-            elif 'pop' in genre:
-                new_genres.add('pop')
-            elif 'rap' in genre:
-                new_genres.add('rap')
-            elif 'rock' in genre:
-                new_genres.add('rock')
-            elif 'reggaeton' in genre:
-                new_genres.add('reggaeton')
-            elif 'r&b' in genre:
-                new_genres.add('r&b')
-            elif 'soul' in genre:
-                new_genres.add('soul')
-            elif 'trap' in genre:
-                new_genres.add('trap')
-            elif 'funk' in genre:
-                new_genres.add('funk')
-            elif 'dance' in genre:
-                new_genres.add('dance')
-            else:
-                new_genres.add(genre)
+        :param genre: name of the genre
+        :return: simplified genre
+        """
+        if genre == 'pop rock' or genre == 'hard rock':
+            return genre
+        elif 'alternative' in genre:
+            return 'alternative'
+        elif 'bollywood' in genre:
+            return 'bollywood'
+        elif 'country' in genre:
+            return 'country'
+        elif 'dancehall' in genre:
+            return 'dancehall'
+        elif 'disco' in genre:
+            return 'disco'
+        elif 'electro' in genre:
+            return 'electro'
+        elif 'electropop' in genre:
+            return 'electro'
+        elif 'edm' in genre:
+            return 'edm'
+        elif 'folk' in genre:
+            return 'folk'
+        elif 'hip hop' in genre:
+            return 'hip hop'
+        elif 'house' in genre:
+            return 'house'
+        elif 'indie' in genre:
+            return 'indie'
+        elif 'jazz' in genre:
+            return 'jazz'
+        elif 'k-pop' in genre:
+            return 'k-pop'
+        elif 'latin' in genre:
+            return 'latin'
+        elif 'metal' in genre:
+            return 'metal'
+        elif 'orchestra' in genre:
+            return 'orchestra'
+        elif 'pop' in genre:
+            return 'pop'
+        elif 'rap' in genre:
+            return 'rap'
+        elif 'rock' in genre:
+            return 'rock'
+        elif 'reggaeton' in genre:
+            return 'reggaeton'
+        elif 'r&b' in genre:
+            return 'r&b'
+        elif 'soul' in genre:
+            return 'soul'
+        elif 'trap' in genre:
+            return 'trap'
+        elif 'funk' in genre:
+            return 'funk'
+        elif 'dance' in genre:
+            return 'dance'
+        else:
+            return genre
 
-        return list(new_genres)
+    def __simplify_genres(self, genres_column: pd.Series) -> pd.Series:
+        """
+        function simplifies genres of every row, each distinct genre
+        is simplified only once and then looked up in mapping table
+        :param genres_column: column with lists of genres
+        :return: column with lists of simplified genres
+        """
+        mapping = {
+            genre: self.simplify_genre(genre)
+            for genre in genres_column.explode().dropna().unique()}
+        return genres_column.map(
+            lambda genres: list({mapping[genre] for genre in genres}))
 
     def preprocess_genres(self) -> None:
         """
         funciton applies simplify genres on dataframes
         """
 
-        self.artists_df['genres'] = self.artists_df.apply(
-            lambda row: self.__simplify_genres(row, 'genres'), axis=1)
-        self.users_df['favourite_genres'] = self.users_df.apply(
-            lambda row: self.__simplify_genres(
-                row, 'favourite_genres'), axis=1)
+        self.artists_df['genres'] = self.__simplify_genres(
+            self.artists_df['genres'])
+        self.users_df['favourite_genres'] = self.__simplify_genres(
+            self.users_df['favourite_genres'])
 
 # Session preprocessing
 
+    @staticmethod
+    def clean_sessions(session_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        function performs basic preprocess for sessions
+        * drops rows where track_id is null
+        * drops sessions where event type is 'advertisment'
+        :param session_df: dataframe with sessions
+        :return: dataframe without dropped rows
+        """
+        return session_df.loc[
+            session_df['track_id'].notna()
+            & (session_df['event_type'] != 'advertisment')]
+
     def preprocess_sessions(self) -> None:
         """
         function performs basic preprocess for sessions
         * drops rows where track_id is null
         * drops sessions where event type is 'advertisment'
         """
-        self.session_df.dropna()
-        self.session_df.drop(
-            self.session_df[self.session_df['event_type'] == 'advertisment']
-            .index, inplace=True)
+        if self.session_df is not None:
+            self.session_df = self.clean_sessions(self.session_df)
 
 # Tracks preprocessing
 
     @staticmethod
-    def change_time_to_sec(row: pd.Series) -> int:
+    def change_time_to_sec(duration_ms: pd.Series) -> pd.Series:
         """
         function changes time representaiton from miliseconds to seconds
-        :param row: row from dataframe
+        :param duration_ms: column with time in miliseconds
         :return: time represented in seconds
         """
-        return row['duration_ms']//1000
+        return duration_ms//1000
 
-    def add_genres(self, row: pd.Series) -> list:
+    def add_genres(self) -> pd.Series:
         """
         function finds genres of the songs by genres of an artist
-        :param row: row from dataframe
-        :return: list of genres of the song
+        with one join of tracks and artists
+        :return: column with list of genres of every song
         """
-        genres = self.artists_df.loc[self.artists_df['id'] == row['id_artist']]['genres']
-        return genres.tolist()[0]
+        artists_genres = (
+            self.artists_df[['id', 'genres']]
+            .drop_duplicates('id')
+            .rename(columns={'id': 'id_artist'}))
+        genres = self.tracks_df[['id_artist']].merge(
+            artists_genres, on='id_artist', how='left')['genres']
+        return pd.Series(genres.to_numpy(), index=self.tracks_df.index)
 
     def one_hot_genres(self) -> None:
         """
         method performs one-hot encoding on genres
         """
+        from sklearn.preprocessing import MultiLabelBinarizer
+
         mlb = MultiLabelBinarizer(sparse_output=True)
 
         self.tracks_df = self.tracks_df.join(
@@ -139,6 +210,7 @@ class Preprocess:
                     mlb.fit_transform(self.tracks_df.pop('genres')),
                     index=self.tracks_df.index,
                     columns=mlb.classes_))
+        self.genre_columns = mlb.classes_.tolist()
 
     def preprocess_tracks(self) -> None:
         """
@@ -147,34 +219,124 @@ class Preprocess:
         *adds genres in one-hot encoding
         *unifies date represenation
         """
-        self.tracks_df['duration_ms'] = self.tracks_df.apply(
-            lambda row: self.change_time_to_sec(row), axis=1)
+        self.tracks_df['duration_ms'] = self.change_time_to_sec(
+            self.tracks_df['duration_ms'])
         self.tracks_df.rename(
             columns={'duration_ms': 'duration_sec'}, inplace=True)
-        self.tracks_df['genres'] = self.tracks_df.apply(
-            lambda row: self.add_genres(row), axis=1)
+        self.tracks_df['genres'] = self.add_genres()
         self.tracks_df['release_date'] = pd.to_datetime(
             self.tracks_df['release_date']).dt.year
         self.one_hot_genres()
 
 # General final methods
 
+    @staticmethod
+    def compact_sessions(session_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        function changes sessions columns to compact types:
+        int32 user ids, categorical track ids and event types
+        :param session_df: dataframe with sessions
+        :return: dataframe with compact types
+        """
+        return compact_df(session_df, 'sessions')
+
+    def compact_dtypes(self) -> None:
+        """
+        method changes columns to compact types for binary storage:
+        * categorical artist and track ids and event types
+        * small integers, int32 durations and user ids
+        * float32 features and dense uint8 one-hot genres
+        """
+        self.tracks_df = compact_df(
+            self.tracks_df, 'tracks', self.genre_columns)
+        if self.session_df is not None:
+            self.session_df = self.compact_sessions(self.session_df)
+        self.users_df = compact_df(self.users_df, 'users')
+
+    def save_dfs(self, file_format: str = 'parquet'):
+        """
+        method saves all dataframes to files, with names of one-hot
+        genre columns of tracks
+        :param file_format: parquet (typed, columnar) or json
+        """
+        save_genre_columns(self.genre_columns)
+        save_df(self.tracks_df, 'tracks', file_format=file_format)
+        if self.session_df is not None:
+            save_df(self.session_df, 'sessions', file_format=file_format)
+        else:
+            self.save_sessions_in_chunks(file_format)
+        save_df(self.artists_df, 'artists', file_format=file_format)
+        save_df(self.users_df, 'users', file_format=file_format)
+
+    def empty_sessions(self) -> pd.DataFrame:
+        """
+        method creates sessions dataframe without rows
+        :return: dataframe with sessions columns of compact types
+        """
+        return self.compact_sessions(pd.DataFrame({
+            'session_id': pd.Series(dtype='int64'),
+            'timestamp': pd.Series(dtype='datetime64[ns]'),
+            'user_id': pd.Series(dtype='int64'),
+            'track_id': pd.Series(dtype='object'),
+            'event_type': pd.Series(dtype='object')}))
+
+    def save_sessions_in_chunks(self, file_format: str = 'parquet') -> int:
+        """
+        method streams sessions from raw file: every chunk is cleaned,
+        compacted and saved before the next one is read, so memory
+        does not grow with the size of the sessions file
+        (with json format chunks are saved as parquet parts and written
+        to one json file at the end, which needs all sessions in memory
+        once), sessions_offset is set to the number of read bytes
+        :param file_format: parquet (typed, columnar) or json
+        :return: number of saved sessions
+        """
+        saved_sessions = 0
+        self.sessions_offset = 0
+        chunks = read_jsonl_chunks(
+            self.path_to_sessions, self.sessions_chunksize)
+        chunk_nr = -1
+        for chunk_nr, (session_df, offset) in enumerate(chunks):
+            session_df = self.compact_sessions(
+                self.clean_sessions(session_df))
+            if chunk_nr == 0:
+                # json file would be rewritten by every appended chunk
+                save_df(session_df, 'sessions', file_format='parquet')
+            else:
+                append_df(session_df, 'sessions')
+            saved_sessions += len(session_df)
+            self.sessions_offset = offset
+        if chunk_nr < 0:
+            # empty file, sessions saved before must not be loaded
+            save_df(self.empty_sessions(), 'sessions',
+                    file_format=file_format)
+        elif file_format != 'parquet':
+            save_df(load_df('sessions'), 'sessions', file_format=file_format)
+        return saved_sessions
+
     def save_dfs_to_json(self):
         """
         method saves all dataframes to json file
         """
-        path = './preprocessed_data/'
-        self.tracks_df.to_json(path+'tracks.json')
-        self.session_df.to_json(path+'sessions.json')
-        self.artists_df.to_json(path+'artists.json')
-        self.users_df.to_json(path+'users.json')
+        self.save_dfs('json')
+
+    def save_feature_store(self):
+        """
+        method builds normalized tracks features used by
+        recommendation model and saves them next to dataframes
+        """
+        FeatureStore.build(self.tracks_df, self.genre_columns) \
+            .save(PREPROCESSED_PATH)
 
-    def preprocess(self):
+    def preprocess(self, file_format: str = 'parquet'):
         """
-        main method that preprocess all dataframes and 
-        saves them to json files
+        main method that preprocess all dataframes and
+        saves them to files together with feature store
+        :param file_format: parquet (typed, columnar) or json
         """
         self.preprocess_genres()
         self.preprocess_sessions()
         self.preprocess_tracks()
-        self.save_dfs_to_json()
\ No newline at end of file
+        self.compact_dtypes()
+        self.save_dfs(file_format)
+        self.save_feature_store()
@@ -1,19 +1,35 @@
+import numpy as np
 import pandas as pd
-import random
 import string
-from sklearn.preprocessing import MinMaxScaler
-from sklearn.metrics.pairwise import cosine_similarity
+
+from feature_store import FeatureStore, get_feature_store
+from instrumentation import count, observe, stage, timed
+from packing import pack_playlist
+from similarity import CosineSimilarity
+from track_index import TrackIndex
 
 
 class RecommendationModel():
+    ranking_depth = 50
+    packing_attempts = 3
+
+    @timed('model.init')
     def __init__(self, first_part_playlist: list,
-                 tracks_df: pd.DataFrame, playlist_duration: tuple) -> None:
+                 tracks_df: pd.DataFrame, playlist_duration: tuple,
+                 track_index: TrackIndex = None,
+                 similarity: CosineSimilarity = None,
+                 feature_store: FeatureStore = None) -> None:
         self.first_part_playlist = first_part_playlist
         self.tracks_df = tracks_df
+        self.track_index = track_index or TrackIndex(tracks_df)
+        self.feature_store = feature_store or get_feature_store(tracks_df)
         self.normalized_df = self.get_normalized_df()
         hours, minutes = playlist_duration
         self.playlist_duration = hours*60*60 + minutes*60
-        self.cosine = self.get_cosine()
+        self.cosine = similarity if similarity is not None \
+            else self.get_cosine()
+        self.ranking = None
+        self.packing = None
 
     def count_duration(self, songs_list: list):
         """
@@ -21,42 +37,31 @@ class RecommendationModel():
         :songs_list: list of the songs to count time
         :return: duration of all these songs
         """
-        total_time = 0
-        for song in songs_list:
-            song_time = int(self.tracks_df.loc[
-                self.tracks_df['id'] == song]['duration_sec'])
-            total_time += song_time
-
-        return total_time
+        count('model.count_duration_calls')
+        return self.track_index.count_duration(songs_list)
 
     def get_feature_columns(self) -> list:
         """
         method get columns which need to be normalized
         :return: list of column names
         """
-        col_to_remove = ['id', 'name', 'id_artist']
-        feature_cols = self.tracks_df.columns.tolist()
-        for col in col_to_remove:
-            feature_cols.remove(col)
-        return feature_cols
+        return self.feature_store.feature_columns
 
-    def get_normalized_df(self) -> list:
+    def get_normalized_df(self) -> np.ndarray:
         """
-        method normalizes data in df
-        :return: normalized df as list
+        method returns normalized data of the df from feature store
+        :return: normalized df as array
         """
-        feature_cols = self.get_feature_columns()
-        scaler = MinMaxScaler()
-        normalized_df = scaler.fit_transform(self.tracks_df[feature_cols])
-        return normalized_df
+        return self.feature_store.features
 
-    def get_cosine(self):
+    def get_cosine(self) -> CosineSimilarity:
         """
-        method caluclated cosine similarity
+        method prepares cosine similarity, which is calculated
+        only for requested songs instead of the whole df
         :return: cosine similarity in given df
         """
-        cosine = cosine_similarity(self.normalized_df)
-        return cosine
+        return CosineSimilarity(
+            self.normalized_df, genres=self.feature_store.genres)
 
     def song_recommendation(self, song_id: string, song_nr: int,
                             model_type: list) -> list:
@@ -67,18 +72,34 @@ class RecommendationModel():
         :param model_type: type of the model (here:cosine_similarity)
         :return: best n matches
         """
-        indices = pd.Series(self.tracks_df.index, index=self.tracks_df['id'])
-        # Get list of songs for given songs
-        score = list(enumerate(model_type[indices[song_id]]))
-        # Sort the most similar songs
-        similarity_score = sorted(score, key=lambda x: x[1], reverse=True)
-        # Select the top-10 recommend songs
-        similarity_score = similarity_score[1:song_nr]
-        top_songs_index = [i[0] for i in similarity_score]
+        position = self.track_index.get_positions([song_id])
+        # Select the top-10 most similar songs (the first one is the song)
+        top_songs_index = model_type.top_k(position, song_nr)[0][1:song_nr]
         # Top 10 recommende songs
         top_songs = self.tracks_df['id'].iloc[top_songs_index]
         return top_songs
 
+    def rank_recommendations(self, song_nr: int, model_type: list) -> list:
+        """
+        method ranks most similar songs to all given songs in one batch,
+        the ranking is deeper than needed so next calls with bigger
+        song_nr reuse it instead of computing it again
+        :param song_nr: number of best recommmendations we want to obtain
+        :param model_type: type of the model (here:cosine_similarity)
+        :return: list with array of ranked songs positions for every song
+        """
+        if self.ranking is not None:
+            ranked_model, depth, ranked = self.ranking
+            if ranked_model is model_type and depth >= song_nr:
+                return ranked
+
+        depth = self.ranking_depth_for(song_nr)
+        positions = self.track_index.get_positions(self.first_part_playlist)
+        with stage('model.cosine'):
+            ranked = model_type.top_k(positions, depth)
+        self.ranking = (model_type, depth, ranked)
+        return ranked
+
     def generate_recommendations(self, song_nr: int, model_type: list):
         """
         method generates recommendations to all given songs
@@ -86,74 +107,97 @@ class RecommendationModel():
         :param model_type: type of the model (here:cosine_similarity)
         :return: list of recommended songs
         """
-        recommended_songs = set()
-        for song_id in self.first_part_playlist:
-            recommended_songs = self.song_recommendation(
-                song_id, song_nr, model_type)
-            for song in recommended_songs:
-                recommended_songs.add(song)
-        return list(recommended_songs)
-
-    def create_playlist(self) -> pd.DataFrame:
+        song_nr = max(song_nr, 1)
+        ranked = self.rank_recommendations(song_nr, model_type)
+        # the first song in every ranking is the given song itself
+        recommended_positions = np.unique(np.concatenate(
+            [neighbours[1:song_nr] for neighbours in ranked]
+            + [np.empty(0, dtype=np.int64)]))
+        return self.track_index.ids[recommended_positions].tolist()
+
+    def rank_candidates(self, song_nr: int, model_type: list) -> list:
         """
-        super complicated
-        try to generate top 10 recommendations for every songs and join them
-        if they too short it adds more recommendations
-        if too long it subtracts the recommended songs
-        :return: list with songs ids
+        method joins recommendations to all given songs taking them
+        in turns (best recommendation of every song, then second...)
+        :param song_nr: number of best recommmendations we want to obtain
+        :param model_type: type of the model (here:cosine_similarity)
+        :return: list of unique recommended songs ids ordered by relevance,
+        without songs already in the playlist
         """
-        recommendation_nr = 10
-
-        recommended_songs = self.generate_recommendations(
-            recommendation_nr, self.cosine)
-        all_playlist = set(self.first_part_playlist + recommended_songs)
-        all_playlist_duration = self.count_duration(all_playlist)
-
-        adding = 0
-        subtracting = 0
-
-        while all_playlist_duration < self.playlist_duration - 600 or all_playlist_duration > self.playlist_duration + 600:
-            if all_playlist_duration < self.playlist_duration:
-                recommendation_nr += 1
-                adding += 1
-                recent_added = True
-            else:
-                recommendation_nr -= 1
-                subtracting += 1
-                recent_added = False
-
-            recommended_songs = self.generate_recommendations(
-                recommendation_nr, self.cosine)
-            all_playlist = set(self.first_part_playlist + recommended_songs)
-
-            all_playlist_duration = self.count_duration(all_playlist)
-
-            if adding != 0 and subtracting != 0:
-                if recent_added:
-
-                    while all_playlist_duration > self.playlist_duration + 600:
-                        recommended_songs.pop(
-                            random.randrange(len(recommended_songs)))
-                        all_playlist = set(
-                            self.first_part_playlist + recommended_songs)
-
-                        all_playlist_duration = self.count_duration(
-                            all_playlist)
-
-                else:
-                    extra_recommended_songs = set(
-                        self.generate_recommendations(
-                            recommendation_nr + 1, self.cosine))
-
-                    while all_playlist_duration < self.playlist_duration - 600:
-                        extra_songs = list(extra_recommended_songs.difference(
-                            set(self.first_part_playlist + recommended_songs)))
-
-                        set(recommended_songs).add(random.choice(extra_songs))
-                        all_playlist = set(
-                            self.first_part_playlist + recommended_songs)
+        ranked = self.rank_recommendations(song_nr, model_type)
+        with stage('model.rank_candidates'):
+            first_part_playlist = set(self.first_part_playlist)
+            candidates = dict()
+            for rank in range(1, song_nr):
+                for neighbours in ranked:
+                    if rank < len(neighbours):
+                        song = self.track_index.ids[neighbours[rank]]
+                        if song not in first_part_playlist:
+                            candidates.setdefault(song)
+        observe('model.candidates', len(candidates))
+        return list(candidates)
+
+    def estimate_recommendation_nr(self, first_part_duration: int) -> int:
+        """
+        method estimates how many recommendations of every song are
+        needed to fill the time remaining after the first part
+        :param first_part_duration: duration of given songs in seconds
+        :return: number of recommendations of every song
+        """
+        remaining_time = self.playlist_duration - first_part_duration
+        median_song_duration = self.tracks_df['duration_sec'].median()
+        remaining_songs_estimate = max(
+            int(remaining_time / median_song_duration), 0)
+        return max(
+            10, 2 * remaining_songs_estimate
+            // max(len(self.first_part_playlist), 1) + 2)
+
+    def ranking_depth_for(self, song_nr: int) -> int:
+        """
+        :return: depth of ranking computed for song_nr recommendations
+        """
+        return max(song_nr * 2, self.ranking_depth)
 
-                        all_playlist_duration = self.count_duration(
-                            all_playlist)
+    def use_ranking(self, recommendations: dict, depth: int) -> None:
+        """
+        method sets ranking of given songs computed earlier (like cached
+        one), deeper ranking is still computed when it is needed
+        :param recommendations: dict with array of ranked songs positions
+        for every song (at least every song of the first part)
+        :param depth: depth of the rankings
+        """
+        ranked = [recommendations[song] for song in self.first_part_playlist]
+        self.ranking = (self.cosine, depth, ranked)
 
-        return self.tracks_df.loc[self.tracks_df['id'].isin(all_playlist)]
+    @timed('model.playlist')
+    def create_playlist(self) -> pd.DataFrame:
+        """
+        joins given songs with recommendations to them:
+        takes recommendations of every song in turns, so the best ones
+        come first, and chooses from them to fill the remaining time
+        the playlist should be within +/- 10 min of its duration,
+        if it cannot be done self.packing tells how far from it it is
+        :return: dataframe with songs of the playlist
+        """
+        first_part_duration = self.count_duration(self.first_part_playlist)
+        recommendation_nr = self.estimate_recommendation_nr(
+            first_part_duration)
+
+        # if recommendations overlap too much to fill the time
+        # they are searched deeper, at most a few times
+        for _ in range(self.packing_attempts):
+            count('model.correction_iterations')
+            candidates = self.rank_candidates(recommendation_nr, self.cosine)
+            with stage('model.packing'):
+                self.packing = pack_playlist(
+                    candidates, self.track_index.get_durations(candidates),
+                    self.playlist_duration, 600, first_part_duration)
+            count('model.packing_iterations', self.packing.iterations)
+            if self.packing.deviation >= -600:
+                break
+            recommendation_nr *= 2
+        all_playlist = set(self.first_part_playlist + self.packing.songs)
+
+        with stage('model.filter_tracks'):
+            return self.tracks_df.loc[
+                self.tracks_df['id'].isin(all_playlist)]
@@ -0,0 +1,268 @@
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from app_state import AppState
+from storage import APP_COLUMNS, PREPROCESSED_PATH
+from user_histories import EVENT_COLUMNS
+
+
+class RequestError(ValueError):
+    """
+    error in the request sent by the client (answered with 400)
+    """
+
+
+class LatencyStats:
+    """
+    latencies of the last requests of every endpoint
+    """
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._latencies = dict()
+        self._counts = dict()
+        self._errors = dict()
+        self._lock = threading.Lock()
+
+    def add(self, endpoint: str, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            self._latencies.setdefault(
+                endpoint, deque(maxlen=self.window)).append(seconds)
+            self._counts[endpoint] = self._counts.get(endpoint, 0) + 1
+            if error:
+                self._errors[endpoint] = self._errors.get(endpoint, 0) + 1
+
+    def summary(self) -> dict:
+        """
+        method calculates latency percentiles of every endpoint
+        :return: dict with stats (in milliseconds) of every endpoint
+        """
+        with self._lock:
+            latencies = {endpoint: np.array(values) * 1000
+                         for endpoint, values in self._latencies.items()}
+            counts = dict(self._counts)
+            errors = dict(self._errors)
+
+        return {
+            endpoint: {
+                'requests': counts[endpoint],
+                'errors': errors.get(endpoint, 0),
+                'mean_ms': float(values.mean()),
+                'p50_ms': float(np.percentile(values, 50)),
+                'p95_ms': float(np.percentile(values, 95)),
+                'max_ms': float(values.max())}
+            for endpoint, values in latencies.items()}
+
+
+class PlaylistService:
+    """
+    playlists and evaluation served from state loaded once,
+    requests are run concurrently by a pool of worker threads
+    """
+    def __init__(self, state: AppState, workers: int = 4):
+        self.state = state
+        self.executor = ThreadPoolExecutor(workers)
+        self.stats = LatencyStats()
+        self.started = time.time()
+        # every endpoint has function parsing the body and request function
+        self.routes = {
+            '/playlist/basic': (self.parse_request, self.basic_playlist),
+            '/playlist/model': (self.parse_request, self.model_playlist),
+            '/evaluate': (self.parse_request, self.evaluate),
+            '/sessions': (self.parse_sessions, self.add_sessions)}
+
+    def parse_request(self, body: dict) -> tuple:
+        """
+        method checks group and duration like the interactive app:
+        2-9 different existing users and duration from 1h to 9h 59min
+        :param body: {"users": [101, 102], "duration": [hours, minutes]}
+        :return: (users_id, (hours, minutes))
+        """
+        try:
+            users_id = [int(user_id) for user_id in body['users']]
+            hours, minutes = map(int, body['duration'])
+        except (KeyError, TypeError, ValueError):
+            raise RequestError(
+                'expected {"users": [ids], "duration": [hours, minutes]}')
+        if not 2 <= len(users_id) <= 9:
+            raise RequestError('group must have 2-9 users')
+        if len(set(users_id)) != len(users_id):
+            raise RequestError('users of the group must be different')
+        unknown = self.state.unknown_users(users_id)
+        if unknown:
+            raise RequestError(f'unknown users: {unknown}')
+        if not (1 <= hours <= 9 and 0 <= minutes < 60):
+            raise RequestError('duration must be between 1h and 9h 59min')
+        return users_id, (hours, minutes)
+
+    def parse_sessions(self, body: dict) -> tuple:
+        """
+        method checks new sessions of existing users
+        :param body: {"sessions": [{"timestamp": "2022-01-01 10:00:00",
+        "user_id": 101, "track_id": "...", "event_type": "play"}]}
+        :return: (dataframe with sessions,)
+        """
+        columns = APP_COLUMNS['sessions']
+        try:
+            sessions_df = pd.DataFrame(
+                [[session[column] for column in columns]
+                 for session in body['sessions']], columns=columns)
+            sessions_df['timestamp'] = pd.to_datetime(
+                sessions_df['timestamp'])
+            sessions_df['user_id'] = sessions_df['user_id'].astype('int64')
+            sessions_df['track_id'] = sessions_df['track_id'].astype(str)
+        except (KeyError, TypeError, ValueError):
+            raise RequestError(
+                f'expected {{"sessions": [{{columns {columns}}}]}}')
+        if sessions_df.empty:
+            raise RequestError('no sessions given')
+        unknown = self.state.unknown_users(
+            sessions_df['user_id'].unique().tolist())
+        if unknown:
+            raise RequestError(f'unknown users: {unknown}')
+        try:
+            self.state.track_index.get_positions(
+                sessions_df['track_id'].unique())
+        except KeyError as error:
+            raise RequestError(error.args[0])
+        events = set(sessions_df['event_type']).difference(EVENT_COLUMNS)
+        if events:
+            raise RequestError(f'unknown event types: {sorted(events)}')
+        return sessions_df,
+
+    @staticmethod
+    def playlist_response(users_id, playlist_duration, playlist) -> dict:
+        return {
+            'users': users_id,
+            'duration': list(playlist_duration),
+            'duration_sec': int(playlist['duration_sec'].sum()),
+            'tracks': playlist[['id', 'name', 'duration_sec']]
+            .to_dict(orient='records')}
+
+    def basic_playlist(self, users_id, playlist_duration) -> dict:
+        playlist = self.state.get_basic_playlist(users_id, playlist_duration)
+        return self.playlist_response(users_id, playlist_duration, playlist)
+
+    def model_playlist(self, users_id, playlist_duration) -> dict:
+        playlist = self.state.get_model_playlist(users_id, playlist_duration)
+        return self.playlist_response(users_id, playlist_duration, playlist)
+
+    def evaluate(self, users_id, playlist_duration) -> dict:
+        return self.state.evaluate_models(users_id, playlist_duration)
+
+    def add_sessions(self, sessions_df) -> dict:
+        return {'added': len(sessions_df),
+                'sessions': self.state.add_sessions(sessions_df)}
+
+    def health(self) -> dict:
+        return {
+            'status': 'ok',
+            'uptime_sec': time.time() - self.started,
+            'tracks': len(self.state.tracks_df),
+            'users': len(self.state.users_df),
+            'sessions': len(self.state.sessions_df),
+            'playlist_cache': self.state.playlist_cache.stats(),
+            'history_cache': self.state.history_cache.stats()}
+
+    def handle(self, path: str, body: dict) -> dict:
+        """
+        method runs request in the worker pool and waits for its result
+        :param path: endpoint, one of self.routes
+        """
+        parse, route = self.routes[path]
+        return self.executor.submit(route, *parse(body)).result()
+
+    def shutdown(self) -> None:
+        self.executor.shutdown()
+
+
+def to_json(data) -> bytes:
+    def convert(value):
+        if isinstance(value, np.generic):
+            return value.item()
+        raise TypeError(f'{type(value).__name__} is not JSON serializable')
+    return json.dumps(data, default=convert).encode()
+
+
+def make_handler(service: PlaylistService):
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, status: int, data) -> None:
+            body = to_json(data)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self.send_json(200, service.health())
+            elif self.path == '/stats':
+                self.send_json(200, service.stats.summary())
+            else:
+                self.send_json(404, {'error': f'no endpoint {self.path}'})
+
+        def do_POST(self):
+            if self.path not in service.routes:
+                self.send_json(404, {'error': f'no endpoint {self.path}'})
+                return
+
+            start = time.perf_counter()
+            status = 200
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                response = service.handle(self.path, body)
+            except (RequestError, json.JSONDecodeError) as error:
+                status, response = 400, {'error': str(error)}
+            except Exception as error:
+                status, response = 500, {'error': repr(error)}
+
+            service.stats.add(
+                self.path, time.perf_counter() - start, status != 200)
+            self.send_json(status, response)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def make_server(service: PlaylistService, host: str = '127.0.0.1',
+                port: int = 8000) -> ThreadingHTTPServer:
+    """
+    function creates http server of the service, port 0 chooses free port
+    """
+    return ThreadingHTTPServer((host, port), make_handler(service))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Playlists HTTP service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--data', default=PREPROCESSED_PATH)
+    args = parser.parse_args()
+
+    print('Loading data...')
+    service = PlaylistService(AppState.load(args.data), args.workers)
+    server = make_server(service, args.host, args.port)
+    print(f'Serving on http://{args.host}:{server.server_port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == '__main__':
+    main()
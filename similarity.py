@@ -0,0 +1,151 @@
+import numpy as np
+import scipy.sparse as sp
+
+
+def top_k_positions(scores: np.ndarray, k: int,
+                    kth_score: float = None) -> np.ndarray:
+    """
+    function selects positions of k highest scores without sorting
+    all of them, ties are ordered by position (like a stable sort)
+    :param scores: one dimensional array of scores
+    :param k: number of positions to select
+    :param kth_score: k-th highest score if it is already known
+    :return: positions of k highest scores, best first
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if kth_score is None:
+        kth_score = np.partition(scores, len(scores) - k)[len(scores) - k]
+    candidates = np.flatnonzero(scores >= kth_score)
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][:k]
+
+
+def unit_rows(features, norms: np.ndarray = None) -> np.ndarray:
+    """
+    function divides every row by its norm (rows of zeros are kept)
+    :param features: two dimensional array of features
+    :param norms: norms of the rows if they are already known
+    :return: array with rows of unit length
+    """
+    features = np.asarray(features)
+    if norms is None:
+        norms = np.linalg.norm(features, axis=1)
+    norms = np.where(norms == 0, 1, norms).astype(features.dtype)
+    return features / norms[:, np.newaxis]
+
+
+# genres denser than this are multiplied as dense columns, for a few
+# dozens of genres shared by many tracks dense products are faster
+DENSE_GENRES_DENSITY = 0.05
+
+
+def unit_blocks(features, genres, genres_weight: float = 1.0) -> tuple:
+    """
+    function divides rows of dense features and sparse genres by norms
+    of the joined rows, genres are weighted first, so dot products
+    of the unit rows are weighted cosine similarities
+    :param features: dense features of tracks (audio features)
+    :param genres: sparse one-hot genres of tracks
+    :param genres_weight: weight of genres in dot products,
+    with 1 it is cosine similarity of all features joined
+    :return: (unit dense features, unit sparse genres as CSR), dense
+    genres are joined to dense features and the sparse block has no columns
+    """
+    features = np.asarray(features)
+    genres = sp.csr_matrix(genres, dtype=features.dtype)
+    if genres_weight != 1:
+        genres = genres * np.sqrt(genres_weight).astype(features.dtype)
+    norms = np.sqrt(np.einsum('ij,ij->i', features, features)
+                    + np.asarray(genres.multiply(genres).sum(axis=1)).ravel())
+    norms = np.where(norms == 0, 1, norms).astype(features.dtype)
+    features = features / norms[:, np.newaxis]
+    genres = sp.csr_matrix(sp.diags(1 / norms) @ genres, dtype=features.dtype)
+    if genres.nnz > DENSE_GENRES_DENSITY * genres.shape[0] * genres.shape[1]:
+        return np.hstack([features, genres.toarray()]), genres[:, :0]
+    return features, genres
+
+
+class CosineSimilarity:
+    """
+    cosine similarity between tracks computed on demand in blocks of
+    seeds, so the full tracks x tracks matrix is never materialized,
+    features can be split into a small dense block and a sparse block
+    of one-hot genres, which are multiplied with sparse operations
+    """
+    def __init__(self, features, norms: np.ndarray = None,
+                 block_size: int = 256, normalized: bool = False,
+                 genres=None, genres_weight: float = 1.0, genres_t=None):
+        """
+        :param features: (dense) features of all tracks
+        :param norms: norms of the features rows if they are known,
+        not used with genres (norms of weighted rows are calculated)
+        :param normalized: True if rows already have unit length (like
+        memory-mapped catalogue features), then they are used without copy
+        :param genres: sparse one-hot genres of all tracks (optional)
+        :param genres_weight: weight of genres block in similarity
+        :param genres_t: normalized genres transposed to CSR (like
+        memory-mapped catalogue genres), used only with normalized
+        genres, transposed here if not given
+        """
+        if normalized:
+            self.features = features
+            self.genres = genres
+        elif genres is None:
+            self.features = unit_rows(features, norms)
+            self.genres = None
+        else:
+            self.features, self.genres = unit_blocks(
+                features, genres, genres_weight)
+            genres_t = None
+        if self.genres is not None and self.genres.shape[1]:
+            self.genres = sp.csr_matrix(self.genres)
+            # transposed once, so blocks of seeds multiply CSR by CSR
+            self.genres_t = sp.csr_matrix(genres_t) if genres_t is not None \
+                else self.genres.T.tocsr()
+        else:
+            self.genres = None
+        self.block_size = block_size
+
+    def scores(self, positions: np.ndarray) -> np.ndarray:
+        """
+        method calculates similarities of given tracks to all tracks
+        :param positions: row positions of the tracks
+        :return: array with row of similarities for every track
+        """
+        scores = self.features[positions] @ self.features.T
+        if self.genres is not None:
+            scores += (self.genres[positions] @ self.genres_t).toarray()
+        return scores
+
+    def __getitem__(self, position: int) -> np.ndarray:
+        """
+        method calculates similarities of one track to all tracks
+        :param position: row position of the track
+        :return: array of similarities
+        """
+        return self.scores(np.array([position]))[0]
+
+    def top_k(self, positions, k: int) -> list:
+        """
+        method finds k most similar tracks to every given track
+        :param positions: row positions of the seed tracks
+        :param k: number of the most similar tracks (seed itself included)
+        :return: list with array of positions for every seed, best first
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        tracks_nr = len(self.features)
+        k = min(k, tracks_nr)
+        if k <= 0:
+            return [np.empty(0, dtype=np.int64) for _ in positions]
+
+        neighbours = []
+        for start in range(0, len(positions), self.block_size):
+            block = positions[start:start + self.block_size]
+            scores = self.scores(block)
+            kth_scores = np.partition(
+                scores, tracks_nr - k, axis=1)[:, tracks_nr - k]
+            for row, kth_score in zip(scores, kth_scores):
+                neighbours.append(top_k_positions(row, k, kth_score))
+        return neighbours
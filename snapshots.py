@@ -0,0 +1,66 @@
+import threading
+import weakref
+
+
+def snapshot_of(df) -> tuple:
+    """
+    :return: (weak reference, rows count) describing dataframe snapshot
+    """
+    return weakref.ref(df), len(df)
+
+
+def is_snapshot(snapshot: tuple, df) -> bool:
+    ref, rows = snapshot
+    return ref() is df and rows == len(df)
+
+
+class SnapshotCache:
+    """
+    values built from a dataframe, kept while the same dataframe with
+    the same rows count (and the same other dataframes given to get)
+    is used and dropped when the dataframe is deleted
+    """
+    def __init__(self, build):
+        """
+        :param build: function building value from dataframe
+        (and other arguments given to get)
+        """
+        self.build = build
+        self._values = dict()
+        self._lock = threading.RLock()
+
+    def get(self, df, *args):
+        """
+        method returns value built from dataframe, it is built
+        only if there is no value of this dataframe snapshot
+        """
+        key = id(df)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is not None:
+                ref, rows, args_snapshots, value = entry
+                if ref() is df and rows == len(df) \
+                        and len(args_snapshots) == len(args) \
+                        and all(map(is_snapshot, args_snapshots, args)):
+                    return value
+
+            value = self.build(df, *args)
+            self.put(df, value, *args)
+            return value
+
+    def put(self, df, value, *args) -> None:
+        """
+        method sets value of the dataframe snapshot built elsewhere
+        :param args: other dataframes the value was built from
+        """
+        key = id(df)
+        with self._lock:
+            ref = weakref.ref(df, lambda _, key=key: self._drop(key))
+            self._values[key] = (
+                ref, len(df), [snapshot_of(arg) for arg in args], value)
+
+    def _drop(self, key: int) -> None:
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is not None and entry[0]() is None:
+                del self._values[key]
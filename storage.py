@@ -0,0 +1,285 @@
+import glob
+import hashlib
+import json
+import os
+import pickle
+
+import pandas as pd
+
+
+PREPROCESSED_PATH = './preprocessed_data/'
+FILE_FORMATS = {'parquet': '.parquet', 'json': '.json'}
+SNAPSHOT_FILE = 'snapshot.pkl'
+GENRE_COLUMNS_FILE = 'genre_columns.json'
+
+# columns needed by every part of the app
+APP_COLUMNS = {
+    'artists': ['id', 'genres'],
+    'tracks': None,
+    'users': ['user_id'],
+    'sessions': ['timestamp', 'user_id', 'track_id', 'event_type'],
+}
+
+# compact types of columns: small integers, categorical ids and event
+# types (integer codes with categories as lookup table), one-hot genres
+# of tracks (saved by preprocessing in the genre columns file) are uint8
+# and the other tracks columns are float32 features
+DTYPES = {
+    'tracks': {'popularity': 'int8', 'duration_sec': 'int32',
+               'explicit': 'int8', 'id_artist': 'category',
+               'release_date': 'int16', 'key': 'int8'},
+    'users': {'user_id': 'int32'},
+    'sessions': {'user_id': 'int32', 'track_id': 'category',
+                 'event_type': 'category'},
+}
+TEXT_COLUMNS = ['id', 'name']
+
+
+def content_hash(df: pd.DataFrame, columns: list = None) -> str:
+    """
+    function hashes values of the dataframe rows in their order, the
+    hash does not depend on categorical or object types of the columns
+    :param columns: columns to hash, all if None
+    :return: hex digest of the rows hashes
+    """
+    if columns is not None:
+        df = df[columns]
+    hashes = pd.util.hash_pandas_object(df, index=False)
+    return hashlib.sha1(hashes.to_numpy().tobytes()).hexdigest()
+
+
+def replace_file(filepath: str, save) -> str:
+    """
+    function saves file to a temporary file which then replaces the
+    given one, so processes which memory-mapped the old file keep
+    reading its unchanged pages
+    :param filepath: path of the file
+    :param save: function saving the file to given path
+    :return: path of the file
+    """
+    directory, name = os.path.split(filepath)
+    temp_filepath = os.path.join(directory, f'.{os.getpid()}-{name}')
+    try:
+        save(temp_filepath)
+        os.replace(temp_filepath, filepath)
+    finally:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+    return filepath
+
+
+def save_json(filepath: str, data) -> str:
+    """
+    function saves data to json file replacing the old one
+    :return: path of the file
+    """
+    def save(path):
+        with open(path, 'w') as json_file:
+            json.dump(data, json_file)
+    return replace_file(filepath, save)
+
+
+def save_genre_columns(genre_columns: list,
+                       path: str = PREPROCESSED_PATH) -> str:
+    """
+    function saves names of one-hot genre columns of tracks, made
+    by preprocessing, next to the preprocessed dataframes
+    :return: path of the saved file
+    """
+    filepath = os.path.join(path, GENRE_COLUMNS_FILE)
+    with open(filepath, 'w') as genres_file:
+        json.dump(list(genre_columns), genres_file)
+    return filepath
+
+
+def load_genre_columns(path: str = PREPROCESSED_PATH) -> list:
+    """
+    function loads names of one-hot genre columns of tracks
+    saved by preprocessing
+    :return: list of column names
+    """
+    with open(os.path.join(path, GENRE_COLUMNS_FILE)) as genres_file:
+        return json.load(genres_file)
+
+
+def compact_df(df: pd.DataFrame, name: str,
+               genre_columns: list = ()) -> pd.DataFrame:
+    """
+    function changes columns of the dataframe to compact types,
+    json files and appended parts are loaded with wide types
+    :param df: dataframe to change
+    :param name: name of the dataframe (tracks, sessions, artists, users)
+    :param genre_columns: one-hot genre columns of tracks (uint8),
+    the other not listed tracks columns are float features
+    :return: dataframe with compact types
+    """
+    dtypes = {column: dtype for column, dtype in DTYPES.get(name, {}).items()
+              if column in df.columns}
+    if name == 'tracks':
+        genre_columns = set(genre_columns)
+        other_columns = df.columns.difference(list(dtypes) + TEXT_COLUMNS)
+        sparse_columns = {
+            column: df[column].sparse.to_dense() for column in other_columns
+            if isinstance(df[column].dtype, pd.SparseDtype)}
+        if sparse_columns:
+            # assign creates new dataframe, given one is not changed
+            df = df.assign(**sparse_columns)
+        for column in other_columns:
+            dtypes[column] = 'uint8' if column in genre_columns \
+                else 'float32'
+    changed = {column: dtype for column, dtype in dtypes.items()
+               if df[column].dtype != dtype}
+    return df.astype(changed) if changed else df
+
+
+def save_df(df: pd.DataFrame, name: str, path: str = PREPROCESSED_PATH,
+            file_format: str = 'parquet') -> str:
+    """
+    function saves dataframe in preprocessed data directory, saved
+    files of the dataframe in the other format and appended parts
+    are removed
+    :param df: dataframe to save
+    :param name: name of the dataframe (tracks, sessions, artists, users)
+    :param path: directory with preprocessed data
+    :param file_format: parquet (typed, columnar) or json
+    :return: path of the saved file
+    """
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f'Unknown file format: {file_format}')
+    filepath = os.path.join(path, name + FILE_FORMATS[file_format])
+    # files of the other format would be loaded or appended to instead
+    remove_parts(name, path)
+    for other_format, extension in FILE_FORMATS.items():
+        other_filepath = os.path.join(path, name + extension)
+        if other_format != file_format and os.path.exists(other_filepath):
+            os.remove(other_filepath)
+    if file_format == 'parquet':
+        df.to_parquet(filepath, index=False)
+    else:
+        df.to_json(filepath)
+    return filepath
+
+
+def load_df(name: str, path: str = PREPROCESSED_PATH,
+            columns: list = None) -> pd.DataFrame:
+    """
+    function loads dataframe from preprocessed data directory,
+    parquet file is preferred and only given columns are read from it,
+    json file is read when there is no parquet one, columns are
+    changed to compact types
+    :param name: name of the dataframe (tracks, sessions, artists, users)
+    :param path: directory with preprocessed data
+    :param columns: columns to load, all if None
+    :return: loaded dataframe
+    """
+    genre_columns = load_genre_columns(path) if name == 'tracks' else ()
+    filepath = os.path.join(path, name + FILE_FORMATS['parquet'])
+    if os.path.exists(filepath):
+        df = pd.read_parquet(filepath, columns=columns)
+        parts = [pd.read_parquet(part_path, columns=columns)
+                 for part_path in get_part_paths(name, path)]
+        if parts:
+            df = pd.concat([df] + parts, ignore_index=True)
+        return compact_df(df, name, genre_columns)
+
+    df = pd.read_json(os.path.join(path, name + FILE_FORMATS['json']))
+    if columns is not None:
+        df = df[columns]
+    return compact_df(df, name, genre_columns)
+
+
+def get_part_paths(name: str, path: str = PREPROCESSED_PATH) -> list:
+    """
+    function finds parquet files appended to the dataframe
+    :return: paths of appended parts in order of appending
+    """
+    return sorted(glob.glob(os.path.join(
+        path, name + '-*' + FILE_FORMATS['parquet'])))
+
+
+def append_df(df: pd.DataFrame, name: str,
+              path: str = PREPROCESSED_PATH) -> str:
+    """
+    function appends rows to saved dataframe, in parquet format they are
+    saved as the next part file without rewriting the saved rows
+    :param df: rows to append
+    :param name: name of the dataframe (tracks, sessions, artists, users)
+    :param path: directory with preprocessed data
+    :return: path of the saved file
+    """
+    if not os.path.exists(os.path.join(path, name + FILE_FORMATS['parquet'])):
+        saved_df = load_df(name, path)
+        return save_df(
+            pd.concat([saved_df, df], ignore_index=True), name, path, 'json')
+
+    part_nr = len(get_part_paths(name, path))
+    filepath = os.path.join(
+        path, f'{name}-{part_nr:05d}' + FILE_FORMATS['parquet'])
+    df.to_parquet(filepath, index=False)
+    return filepath
+
+
+def remove_parts(name: str, path: str = PREPROCESSED_PATH) -> None:
+    """
+    function removes parquet files appended to the dataframe
+    """
+    for part_path in get_part_paths(name, path):
+        os.remove(part_path)
+
+
+def files_signature(names, path: str = PREPROCESSED_PATH) -> list:
+    """
+    function describes saved files of the dataframes (with appended
+    parts), so changes of the preprocessed data are noticed
+    :return: list of (file name, size, modification time) of every file
+    """
+    signature = []
+    for name in names:
+        filepaths = [os.path.join(path, name + extension)
+                     for extension in FILE_FORMATS.values()]
+        for filepath in filepaths + get_part_paths(name, path):
+            if os.path.exists(filepath):
+                stat = os.stat(filepath)
+                signature.append((os.path.basename(filepath),
+                                  stat.st_size, stat.st_mtime_ns))
+    return signature
+
+
+def save_snapshot(dfs: dict, path: str = PREPROCESSED_PATH) -> str:
+    """
+    function saves loaded app dataframes to one binary snapshot file,
+    which is read much faster than parquet or json files (categories
+    are kept as integer codes)
+    :param dfs: dict with dataframe of every name, loaded with APP_COLUMNS
+    :param path: directory with preprocessed data
+    :return: path of the saved file
+    """
+    filepath = os.path.join(path, SNAPSHOT_FILE)
+    snapshot = {'columns': APP_COLUMNS,
+                'dtypes': DTYPES,
+                'signature': files_signature(dfs, path),
+                'dfs': dfs}
+    with open(filepath, 'wb') as snapshot_file:
+        pickle.dump(snapshot, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+    return filepath
+
+
+def load_snapshot(names, path: str = PREPROCESSED_PATH) -> dict:
+    """
+    function loads app dataframes from the snapshot file
+    :param names: names of the dataframes
+    :param path: directory with preprocessed data
+    :return: dict with dataframe of every name, None if there is no
+    snapshot or it is older than preprocessed data
+    """
+    filepath = os.path.join(path, SNAPSHOT_FILE)
+    if not os.path.exists(filepath):
+        return None
+    with open(filepath, 'rb') as snapshot_file:
+        snapshot = pickle.load(snapshot_file)
+    if snapshot['columns'] != APP_COLUMNS \
+            or snapshot.get('dtypes') != DTYPES \
+            or snapshot['signature'] != files_signature(names, path) \
+            or set(snapshot['dfs']) != set(names):
+        return None
+    return snapshot['dfs']
@@ -0,0 +1,128 @@
+import os
+import string
+
+import numpy as np
+import pandas as pd
+
+
+RAW_GENRES = [
+    'dance pop', 'canadian pop', 'pop rock', 'hard rock', 'album rock',
+    'modern alternative rock', 'latin pop', 'trap latino', 'reggaeton',
+    'k-pop', 'uk hip hop', 'rap', 'deep house', 'edm', 'electropop',
+    'indie folk', 'jazz fusion', 'soul', 'r&b', 'funk metal', 'disco',
+    'contemporary country', 'dancehall', 'filmi bollywood', 'orchestra']
+EVENT_TYPES = ['play', 'skip', 'like', 'advertisment']
+EVENT_WEIGHTS = [0.7, 0.15, 0.08, 0.07]
+ID_CHARS = np.array(list(string.ascii_letters + string.digits))
+
+
+def random_ids(generator: np.random.Generator, count: int) -> np.ndarray:
+    """
+    function draws distinct ids looking like ids in the raw data
+    :return: array of 22 characters long ids
+    """
+    ids = set()
+    while len(ids) < count:
+        chars = generator.choice(ID_CHARS, (count - len(ids), 22))
+        ids.update(''.join(row) for row in chars)
+    return np.array(sorted(ids))
+
+
+def random_genres(generator: np.random.Generator, count: int,
+                  max_genres: int = 3) -> list:
+    """
+    function draws lists of 1 to max_genres raw genres
+    """
+    return [list(generator.choice(RAW_GENRES, size, replace=False))
+            for size in generator.integers(1, max_genres + 1, count)]
+
+
+def generate_artists(generator, artists_nr: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        'id': random_ids(generator, artists_nr),
+        'name': [f'Artist {nr}' for nr in range(artists_nr)],
+        'genres': random_genres(generator, artists_nr)})
+
+
+def generate_tracks(generator, tracks_nr: int,
+                    artists_df: pd.DataFrame) -> pd.DataFrame:
+    years = generator.integers(1960, 2022, tracks_nr)
+    return pd.DataFrame({
+        'id': random_ids(generator, tracks_nr),
+        'name': [f'Track {nr}' for nr in range(tracks_nr)],
+        'popularity': generator.integers(0, 101, tracks_nr),
+        'duration_ms': generator.integers(90000, 420000, tracks_nr),
+        'explicit': generator.integers(0, 2, tracks_nr),
+        'id_artist': generator.choice(artists_df['id'], tracks_nr),
+        'release_date': [f'{year}-01-01' for year in years],
+        'danceability': generator.random(tracks_nr),
+        'energy': generator.random(tracks_nr),
+        'key': generator.integers(0, 12, tracks_nr),
+        'loudness': -30 * generator.random(tracks_nr),
+        'speechiness': generator.random(tracks_nr),
+        'acousticness': generator.random(tracks_nr),
+        'instrumentalness': generator.random(tracks_nr),
+        'liveness': generator.random(tracks_nr),
+        'valence': generator.random(tracks_nr),
+        'tempo': 60 + 140 * generator.random(tracks_nr)})
+
+
+def generate_users(generator, users_nr: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        'user_id': np.arange(101, 101 + users_nr),
+        'name': [f'User {nr}' for nr in range(users_nr)],
+        'city': 'Warszawa',
+        'street': 'ul. Nowa 1',
+        'favourite_genres': random_genres(generator, users_nr),
+        'premium_user': generator.random(users_nr) < 0.3})
+
+
+def generate_sessions(generator, sessions_nr: int, tracks_df: pd.DataFrame,
+                      users_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    function draws session events, tracks popularity follows zipf
+    distribution, so users histories overlap like in the real data
+    """
+    tracks_nr = len(tracks_df)
+    popular = (generator.zipf(1.3, sessions_nr) - 1) % tracks_nr
+    uniform = generator.integers(0, tracks_nr, sessions_nr)
+    positions = np.where(generator.random(sessions_nr) < 0.7,
+                         popular, uniform)
+    event_types = generator.choice(EVENT_TYPES, sessions_nr, p=EVENT_WEIGHTS)
+    track_ids = tracks_df['id'].to_numpy()[positions].astype(object)
+    track_ids[event_types == 'advertisment'] = None
+
+    seconds = np.cumsum(generator.integers(1, 600, sessions_nr))
+    timestamps = pd.Timestamp('2022-01-01') + pd.to_timedelta(seconds, 's')
+    return pd.DataFrame({
+        'session_id': np.arange(sessions_nr) // 20,
+        'timestamp': timestamps.strftime('%Y-%m-%dT%H:%M:%S.%f').str[:-3],
+        'user_id': generator.choice(users_df['user_id'], sessions_nr),
+        'track_id': track_ids,
+        'event_type': event_types})
+
+
+def generate_data(path: str, tracks_nr: int = 10000, artists_nr: int = 1000,
+                  users_nr: int = 50, sessions_nr: int = 100000,
+                  seed: int = 0) -> dict:
+    """
+    function generates raw data files with the same schemas as the
+    real artists, tracks, users and sessions files
+    :param path: directory where files are saved
+    :param seed: seed of random generator
+    :return: dict with paths of generated files
+    """
+    generator = np.random.default_rng(seed)
+    artists_df = generate_artists(generator, artists_nr)
+    tracks_df = generate_tracks(generator, tracks_nr, artists_df)
+    users_df = generate_users(generator, users_nr)
+    sessions_df = generate_sessions(
+        generator, sessions_nr, tracks_df, users_df)
+
+    os.makedirs(path, exist_ok=True)
+    paths = dict()
+    for name, df in [('artists', artists_df), ('sessions', sessions_df),
+                     ('tracks', tracks_df), ('users', users_df)]:
+        paths[name] = os.path.join(path, name + '.jsonl')
+        df.to_json(paths[name], orient='records', lines=True)
+    return paths
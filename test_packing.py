@@ -0,0 +1,88 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import packing
+from packing import fill_gap, pack_playlist
+
+
+class PackPlaylistTest(unittest.TestCase):
+    """
+    packing songs of given durations into target +/- tolerance
+    """
+    def test_greedy_within_tolerance(self):
+        result = pack_playlist(['a', 'b', 'c', 'd'], [100, 120, 90, 200],
+                               target=300, tolerance=20)
+        self.assertEqual(result.songs, ['a', 'b', 'c'])
+        self.assertEqual(result.duration, 310)
+        self.assertTrue(result.within_tolerance)
+
+    def test_required_duration(self):
+        result = pack_playlist(['a', 'b'], [100, 100], target=300,
+                               tolerance=10, required_duration=200)
+        self.assertEqual(result.songs, ['a'])
+        self.assertEqual(result.duration, 300)
+
+    def test_knapsack_fills_range_missed_by_greedy(self):
+        # greedy takes 200 and then nothing fits in the left 100 +/- 5
+        result = pack_playlist(['a', 'b', 'c'], [200, 150, 150],
+                               target=300, tolerance=5)
+        self.assertEqual(result.songs, ['b', 'c'])
+        self.assertEqual(result.deviation, 0)
+        self.assertTrue(result.within_tolerance)
+
+    def test_knapsack_prefers_higher_scores(self):
+        result = pack_playlist(['a', 'b', 'c', 'd'], [250, 100, 200, 200],
+                               target=300, tolerance=5,
+                               scores=np.array([4, 3, 1, 2]))
+        self.assertEqual(result.songs, ['b', 'd'])
+
+    def test_unreachable_range_reports_deviation(self):
+        result = pack_playlist(['a', 'b'], [200, 400], target=300,
+                               tolerance=10)
+        self.assertEqual(result.songs, ['a'])
+        self.assertEqual(result.deviation, -100)
+        self.assertFalse(result.within_tolerance)
+
+    def test_no_candidates(self):
+        result = pack_playlist([], [], target=300, tolerance=10)
+        self.assertEqual(result.songs, [])
+        self.assertEqual(result.deviation, -300)
+
+    def test_iterations_exhausted(self):
+        result = pack_playlist(['a', 'b', 'c', 'd'], [100, 100, 100, 100],
+                               target=400, tolerance=10, max_iterations=2)
+        self.assertEqual(result.songs, ['a', 'b'])
+        self.assertEqual(result.iterations, 4)
+        self.assertEqual(result.deviation, -200)
+
+    def test_time_budget_exhausted(self):
+        # only the greedy pass runs after the deadline
+        result = pack_playlist(['a', 'b', 'c'], [200, 150, 150],
+                               target=300, tolerance=5, time_budget=0)
+        self.assertEqual(result.songs, ['a'])
+        self.assertEqual(result.iterations, 3)
+        self.assertEqual(result.deviation, -100)
+
+
+class FillGapTest(unittest.TestCase):
+    def test_table_size_limits_candidates(self):
+        durations = np.array([60, 60, 50, 50])
+        scores = np.array([4, 3, 2, 1])
+        with mock.patch.object(packing, 'MAX_KNAPSACK_CELLS', 2 * 101):
+            chosen, iterations = fill_gap(
+                durations, scores, min_gap=95, max_gap=100, target_gap=100,
+                max_iterations=10, deadline=float('inf'))
+        # only the first two candidates fit in the table
+        self.assertEqual(iterations, 2)
+        self.assertEqual(chosen, [0])
+
+        chosen, _ = fill_gap(
+            durations, scores, min_gap=95, max_gap=100, target_gap=100,
+            max_iterations=10, deadline=float('inf'))
+        self.assertEqual(chosen, [2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from playlist_cache import CandidatePool, PlaylistCache
+
+
+class PlaylistCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = PlaylistCache()
+        self.builds = 0
+
+    def build(self, users_id, playlist_duration):
+        self.builds += 1
+        return CandidatePool(list(users_id))
+
+    def test_pool_reused_in_bucket(self):
+        self.cache.get_pool('model', [1, 2], (2, 10), self.build)
+        self.cache.get_pool('model', [2, 1], (2, 40), self.build)
+        self.assertEqual(self.builds, 1)
+        self.cache.get_pool('model', [1, 2], (3, 0), self.build)
+        self.assertEqual(self.builds, 2)
+
+    def test_invalidate_users(self):
+        self.cache.get_pool('model', [1, 2], (2, 0), self.build)
+        self.cache.get_pool('model', [3, 4], (2, 0), self.build)
+        self.cache.invalidate([1])
+        self.cache.get_pool('model', [3, 4], (2, 0), self.build)
+        self.assertEqual(self.builds, 2)
+        self.cache.get_pool('model', [1, 2], (2, 0), self.build)
+        self.assertEqual(self.builds, 3)
+
+    def test_pool_built_during_invalidation_is_not_stored(self):
+        def build_with_new_sessions(users_id, playlist_duration):
+            # sessions added while the pool is built
+            self.cache.invalidate(users_id)
+            return self.build(users_id, playlist_duration)
+
+        pool = self.cache.get_pool(
+            'model', [1, 2], (2, 0), build_with_new_sessions)
+        self.assertEqual(pool.favourites, [1, 2])
+        self.assertEqual(self.cache.stats()['size'], 0)
+        self.cache.get_pool('model', [1, 2], (2, 0), self.build)
+        self.assertEqual(self.builds, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+from app_state import AppState
+from preprocess import Preprocess
+from service import PlaylistService, make_server
+from storage import PREPROCESSED_PATH
+from synthetic_data import generate_data
+from user_histories import get_interactions
+
+
+class ServiceTest(unittest.TestCase):
+    """
+    service started on a free local port with small synthetic data
+    and called like a client would do it
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.working_dir = os.getcwd()
+        cls.directory = tempfile.TemporaryDirectory()
+        os.chdir(cls.directory.name)
+        os.makedirs(PREPROCESSED_PATH)
+        paths = generate_data('data', tracks_nr=1000, artists_nr=100,
+                              users_nr=10, sessions_nr=20000)
+        Preprocess(paths['artists'], paths['sessions'],
+                   paths['tracks'], paths['users']).preprocess()
+
+        state = AppState.load()
+        cls.users = state.users_df['user_id'].tolist()[:3]
+        cls.service = PlaylistService(state, workers=2)
+        cls.server = make_server(cls.service, port=0)
+        threading.Thread(target=cls.server.serve_forever, daemon=True) \
+            .start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.service.shutdown()
+        os.chdir(cls.working_dir)
+        cls.directory.cleanup()
+
+    def request(self, path: str, body: dict = None) -> tuple:
+        """
+        method sends GET request or POST request with json body
+        :return: (status, json response)
+        """
+        data = None if body is None else json.dumps(body).encode()
+        request = urllib.request.Request(
+            self.url + path, data, {'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as error:
+            return error.code, json.load(error)
+
+    def test_health(self):
+        status, response = self.request('/health')
+        self.assertEqual(status, 200)
+        self.assertEqual(response['status'], 'ok')
+        self.assertEqual(response['tracks'], 1000)
+
+    def test_playlists(self):
+        for path in ('/playlist/basic', '/playlist/model'):
+            with self.subTest(path=path):
+                status, response = self.request(
+                    path, {'users': self.users, 'duration': [1, 30]})
+                self.assertEqual(status, 200)
+                self.assertEqual(response['users'], self.users)
+                self.assertTrue(response['tracks'])
+                self.assertEqual(
+                    response['duration_sec'],
+                    sum(track['duration_sec']
+                        for track in response['tracks']))
+
+    def test_evaluate(self):
+        status, response = self.request(
+            '/evaluate', {'users': self.users, 'duration': [2, 0]})
+        self.assertEqual(status, 200)
+        self.assertTrue(response)
+
+    def test_add_sessions(self):
+        track_id = self.service.state.tracks_df['id'].iloc[0]
+        session = {'timestamp': '2022-01-01 10:00:00',
+                   'user_id': self.users[0], 'track_id': track_id,
+                   'event_type': 'play'}
+        sessions_nr = len(self.service.state.sessions_df)
+        status, response = self.request('/sessions', {'sessions': [session]})
+        self.assertEqual(status, 200)
+        self.assertEqual(response, {'added': 1, 'sessions': sessions_nr + 1})
+        self.assertIn(track_id, get_interactions(
+            self.service.state.sessions_df).played_tracks(self.users[:1]))
+
+        for bad_session in ({**session, 'user_id': -1},
+                            {**session, 'track_id': 'unknown'},
+                            {**session, 'event_type': 'advertisment'},
+                            {'user_id': self.users[0]}):
+            with self.subTest(session=bad_session):
+                status, _ = self.request(
+                    '/sessions', {'sessions': [bad_session]})
+                self.assertEqual(status, 400)
+
+    def test_bad_request(self):
+        for body in ({'users': self.users[:1], 'duration': [1, 0]},
+                     {'users': [-1, -2], 'duration': [1, 0]},
+                     {'users': self.users[:1] * 2, 'duration': [1, 0]},
+                     {'users': self.users + self.users[:1],
+                      'duration': [1, 0]},
+                     {'users': self.users, 'duration': [10, 0]},
+                     {'users': self.users}):
+            with self.subTest(body=body):
+                status, response = self.request('/playlist/basic', body)
+                self.assertEqual(status, 400)
+                self.assertIn('error', response)
+
+    def test_unknown_endpoint(self):
+        self.assertEqual(self.request('/playlist/other', {})[0], 404)
+        self.assertEqual(self.request('/other')[0], 404)
+
+    def test_stats(self):
+        self.request('/playlist/basic',
+                     {'users': self.users, 'duration': [1, 0]})
+        status, response = self.request('/stats')
+        self.assertEqual(status, 200)
+        self.assertGreaterEqual(response['/playlist/basic']['requests'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+
+class TrackIndex:
+    """
+    precomputed index of the tracks catalogue, built once at load time
+    and shared by the playlist classes and recommendation model
+    """
+    def __init__(self, tracks_df: pd.DataFrame,
+                 durations: np.ndarray = None):
+        """
+        :param tracks_df: dataframe with tracks
+        :param durations: durations of the tracks in seconds in tracks df
+        order (like memory-mapped ones), taken from tracks df if None
+        """
+        self.ids = pd.Index(tracks_df['id'])
+        # pandas builds hash table of the index on the first lookup,
+        # which is not thread safe, so it is built before sharing
+        self.ids.is_unique
+        if durations is None:
+            durations = np.ascontiguousarray(
+                tracks_df['duration_sec'].to_numpy(dtype=np.int64))
+        self.durations = durations
+
+    def get_positions(self, songs_list) -> np.ndarray:
+        """
+        method finds row positions of given songs in tracks dataframe
+        :param songs_list: ids of the songs
+        :return: array with row position of every song
+        """
+        songs_list = list(songs_list)
+        positions = self.ids.get_indexer(songs_list)
+        if (positions < 0).any():
+            missing = [song for song, position in zip(songs_list, positions)
+                       if position < 0]
+            raise KeyError(f'Unknown tracks: {missing}')
+        return positions
+
+    def song_duration(self, song_id: str) -> int:
+        """
+        method finds duration of one song
+        :param song_id: id of the song
+        :return: duration of the song in seconds
+        """
+        return int(self.durations[self.ids.get_loc(song_id)])
+
+    def get_durations(self, songs_list) -> np.ndarray:
+        """
+        method finds durations of given songs
+        :param songs_list: ids of the songs
+        :return: array with duration of every song in seconds
+        """
+        if not len(songs_list):
+            return np.empty(0, dtype=np.int64)
+        return self.durations[self.get_positions(songs_list)]
+
+    def count_duration(self, songs_list) -> int:
+        """
+        method counts duration of given songs
+        :param songs_list: ids of the songs (repeated ids are counted
+        as many times as they appear)
+        :return: duration of all these songs in seconds
+        """
+        return int(self.get_durations(songs_list).sum())
@@ -0,0 +1,335 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import threading
+import weakref
+
+from collections import OrderedDict
+from itertools import count
+
+from snapshots import SnapshotCache
+
+
+EVENT_COLUMNS = {'play': 'played', 'skip': 'skipped', 'like': 'liked'}
+
+
+def add_dislikes(events) -> np.ndarray:
+    """
+    function determines which songs are disliked by user
+    (more than half of playings were skipped)
+    :param events: mapping with played and skipped arrays
+    :return: 1 if song is disliked, 0 if not
+    """
+    return (events['skipped'] > events['played']*0.5).astype(np.int64)
+
+
+def scale_playings(events) -> np.ndarray:
+    """
+    function scales playings (doubles
+    or triples it due to number of likes)
+    :param events: mapping with played and liked arrays
+    :return: scaled playings
+    """
+    played = np.asarray(events['played'], dtype=np.int64)
+    liked = np.asarray(events['liked'])
+    scaled = np.where(liked >= 5, played*3, played*2)
+    return np.where(liked == 0, played, scaled)
+
+
+def get_codes(column: pd.Series) -> tuple:
+    """
+    function codes values of the column with integers, categorical
+    columns already keep them
+    :return: (array of codes, index with value of every code)
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy(), column.cat.categories
+    codes, values = pd.factorize(column.to_numpy(), sort=True)
+    return codes, pd.Index(values)
+
+
+class InteractionMatrix:
+    """
+    sparse (CSR) user x track matrices with numbers of plays, skips
+    and likes, users and tracks are coded with integers and all
+    matrices share one structure: a (user, track) pair is stored
+    if the user has any event of the track, so memory grows with the
+    number of events and not with users x tracks
+    """
+    def __init__(self, users, tracks, indptr: np.ndarray,
+                 indices: np.ndarray, data: dict):
+        """
+        :param users: ids of users (rows)
+        :param tracks: ids of tracks (columns)
+        :param indptr: CSR rows pointers shared by all matrices
+        :param indices: CSR columns of stored pairs shared by all matrices
+        :param data: arrays of played, skipped and liked numbers of stored
+        pairs (may be memory-mapped), scaled_played and disliked arrays
+        are calculated if they are not given
+        """
+        self.users = pd.Index(users)
+        # hash table built before the matrix is shared between threads
+        self.users.is_unique
+        self.tracks = pd.Index(tracks)
+        self.indptr = indptr
+        self.indices = indices
+
+        # rules of favourite songs calculated once for all pairs
+        self.data = dict(data)
+        if 'scaled_played' not in self.data:
+            self.data['scaled_played'] = scale_playings(self.data)
+        if 'disliked' not in self.data:
+            self.data['disliked'] = add_dislikes(self.data)
+
+        self.matrices = {
+            event: self.csr_matrix(self.data[column])
+            for event, column in EVENT_COLUMNS.items()}
+        self.scaled_played = self.csr_matrix(self.data['scaled_played'])
+        self.disliked = self.csr_matrix(self.data['disliked'])
+
+    @classmethod
+    def from_sessions(cls, sessions_df: pd.DataFrame) -> 'InteractionMatrix':
+        """
+        method counts events of every (user, track) pair of sessions
+        :param sessions_df: dataframe with sessions
+        :return: interaction matrix of the sessions
+        """
+        sessions_df = sessions_df.loc[sessions_df['track_id'].notna()]
+        user_codes, users = pd.factorize(
+            sessions_df['user_id'].to_numpy(), sort=True)
+        track_codes, tracks = get_codes(sessions_df['track_id'])
+        tracks_nr = max(len(tracks), 1)
+
+        pairs = user_codes.astype(np.int64) * tracks_nr + track_codes
+        pairs, events_pairs = np.unique(pairs, return_inverse=True)
+        indices = (pairs % tracks_nr).astype(np.int32)
+        indptr = np.searchsorted(
+            pairs // tracks_nr, np.arange(len(users) + 1)).astype(np.int64)
+
+        # events compared by their small integer codes, not strings
+        event_codes, event_types = get_codes(sessions_df['event_type'])
+        data = dict()
+        for event, column in EVENT_COLUMNS.items():
+            code = event_types.get_indexer([event])[0]
+            event_pairs = events_pairs[event_codes == code] if code >= 0 \
+                else events_pairs[:0]
+            data[column] = np.bincount(
+                event_pairs, minlength=len(pairs)).astype(np.int32)
+        return cls(users, tracks, indptr, indices, data)
+
+    def csr_matrix(self, data: np.ndarray) -> sp.csr_matrix:
+        """
+        method creates matrix with given values of the stored pairs,
+        the arrays are used without copying
+        """
+        return sp.csr_matrix((data, self.indices, self.indptr),
+                             shape=(len(self.users), len(self.tracks)),
+                             copy=False)
+
+    def user_rows(self, users_id: list) -> np.ndarray:
+        """
+        :return: rows of given users, -1 for users without sessions
+        """
+        return self.users.get_indexer(users_id)
+
+    def user_slice(self, row: int) -> slice:
+        """
+        :return: slice of the user row in data and indices arrays
+        """
+        if row < 0:
+            return slice(0, 0)
+        return slice(self.indptr[row], self.indptr[row + 1])
+
+    def user_history(self, row: int, columns: dict) -> pd.DataFrame:
+        """
+        method creates history of user from the row of given matrices
+        :param row: row of the user
+        :param columns: dict with matrix of every column
+        :return: dataframe indexed by track_id
+        """
+        user_slice = self.user_slice(row)
+        return pd.DataFrame(
+            {column: matrix.data[user_slice]
+             for column, matrix in columns.items()},
+            index=self.tracks[self.indices[user_slice]].rename(None))
+
+    def played_histories(self, users_id: list) -> list:
+        return [self.user_history(row, {0: self.matrices['play']})
+                for row in self.user_rows(users_id)]
+
+    def favourite_histories(self, users_id: list) -> list:
+        return [self.user_history(row, {'played': self.scaled_played,
+                                        'dislike': self.disliked})
+                for row in self.user_rows(users_id)]
+
+    def tracks_with(self, matrix: sp.csr_matrix, users_id: list) -> set:
+        """
+        method finds tracks with nonzero value in rows of given users
+        :return: set of track ids
+        """
+        positions = [np.empty(0, dtype=np.int32)]
+        for row in self.user_rows(users_id):
+            user_slice = self.user_slice(row)
+            positions.append(
+                self.indices[user_slice][matrix.data[user_slice] > 0])
+        return set(self.tracks[np.unique(np.concatenate(positions))])
+
+    def played_tracks(self, users_id: list) -> set:
+        return self.tracks_with(self.matrices['play'], users_id)
+
+
+_interactions = SnapshotCache(InteractionMatrix.from_sessions)
+
+
+def get_interactions(sessions_df: pd.DataFrame) -> InteractionMatrix:
+    """
+    function returns interaction matrix of sessions, it is built
+    only once while the same sessions dataframe is used
+    """
+    return _interactions.get(sessions_df)
+
+
+def set_interactions(sessions_df: pd.DataFrame,
+                     interactions: InteractionMatrix) -> None:
+    """
+    function sets interaction matrix built earlier (like memory-mapped
+    one) as the matrix of sessions
+    """
+    _interactions.put(sessions_df, interactions)
+
+
+def played_histories(sessions_df: pd.DataFrame, users_id: list) -> list:
+    """
+    function creates histories of given users with number of playings
+    of every track (the format used by BasicPlaylist)
+    :return: list of dataframes with one column of playings
+    """
+    return get_interactions(sessions_df).played_histories(users_id)
+
+
+def favourite_histories(sessions_df: pd.DataFrame, users_id: list) -> list:
+    """
+    function creates histories of given users with scaled playings and
+    dislike flag of every track (the format used by FavouriteSongsPlaylist)
+    :return: list of dataframes with played and dislike columns
+    """
+    return get_interactions(sessions_df).favourite_histories(users_id)
+
+
+class HistoryCache:
+    """
+    size-bounded LRU cache of users histories keyed by
+    (history type, user_id, sessions snapshot)
+    """
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._histories = OrderedDict()
+        self._snapshots = dict()
+        self._snapshot_counter = count()
+        self._lock = threading.RLock()
+
+    def snapshot(self, sessions_df: pd.DataFrame) -> int:
+        """
+        method finds token of the sessions snapshot, the token changes
+        when another dataframe is given or the rows count has changed
+        :param sessions_df: dataframe with sessions
+        :return: token of the snapshot
+        """
+        with self._lock:
+            key = id(sessions_df)
+            entry = self._snapshots.get(key)
+            if entry is not None:
+                ref, rows, token = entry
+                if ref() is sessions_df and rows == len(sessions_df):
+                    return token
+                self.invalidate(snapshot=token)
+
+            token = next(self._snapshot_counter)
+            ref = weakref.ref(
+                sessions_df,
+                lambda _, token=token, key=key: self._drop_snapshot(key, token))
+            self._snapshots[key] = (ref, len(sessions_df), token)
+            return token
+
+    def _drop_snapshot(self, key: int, token: int) -> None:
+        with self._lock:
+            entry = self._snapshots.get(key)
+            if entry is not None and entry[2] == token:
+                del self._snapshots[key]
+            self.invalidate(snapshot=token)
+
+    def get_histories(self, sessions_df: pd.DataFrame, users_id: list,
+                      build=favourite_histories) -> list:
+        """
+        method returns histories of given users, histories missing in
+        cache are built together in one pass
+        :param sessions_df: dataframe with sessions
+        :param users_id: ids of users
+        :param build: function building histories (played_histories
+        or favourite_histories)
+        :return: list of copies of users histories
+        """
+        with self._lock:
+            token = self.snapshot(sessions_df)
+            keys = [(build.__name__, user_id, token) for user_id in users_id]
+
+            missing_users = []
+            for key, user_id in zip(keys, users_id):
+                if key in self._histories:
+                    self.hits += 1
+                    self._histories.move_to_end(key)
+                elif user_id not in missing_users:
+                    self.misses += 1
+                    missing_users.append(user_id)
+
+            built = dict()
+            if missing_users:
+                built = dict(zip(
+                    missing_users, build(sessions_df, missing_users)))
+                for user_id, user_history in built.items():
+                    self._histories[(build.__name__, user_id, token)] = \
+                        user_history
+
+            users_histories = [
+                built[user_id] if user_id in built else self._histories[key]
+                for key, user_id in zip(keys, users_id)]
+
+            while len(self._histories) > self.max_size:
+                self._histories.popitem(last=False)
+
+            return [user_history.copy() for user_history in users_histories]
+
+    def invalidate(self, user_id: int = None, snapshot: int = None) -> None:
+        """
+        method removes histories from cache, all of them if no
+        user or snapshot is given
+        :param user_id: id of the user whose histories are removed
+        :param snapshot: token of sessions snapshot to remove
+        """
+        with self._lock:
+            if user_id is None and snapshot is None:
+                self._histories.clear()
+                return
+            for key in list(self._histories):
+                _, key_user_id, key_snapshot = key
+                if user_id is not None and key_user_id != user_id:
+                    continue
+                if snapshot is not None and key_snapshot != snapshot:
+                    continue
+                self._histories.pop(key, None)
+
+    def stats(self) -> dict:
+        """
+        method returns cache counters
+        :return: dict with hits, misses, hit ratio and size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'size': len(self._histories),
+                'max_size': self.max_size}
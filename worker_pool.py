@@ -0,0 +1,55 @@
+import multiprocessing
+
+from app_state import AppState
+from storage import PREPROCESSED_PATH
+
+
+# state shared by worker processes, with fork start method workers
+# use the parent's loaded data (copy-on-write) instead of pickled copies
+_state = None
+
+
+def get_state() -> AppState:
+    """
+    function returns state of the current (worker) process
+    """
+    return _state
+
+
+def init_worker(path: str) -> None:
+    """
+    function loads state in worker process if it was not inherited
+    """
+    global _state
+    if _state is None:
+        _state = AppState.load(path)
+
+
+def run_tasks(state: AppState, function, tasks: list, workers: int = 1,
+              path: str = PREPROCESSED_PATH, ordered: bool = True):
+    """
+    function runs tasks in a pool of processes sharing loaded state,
+    tasks read the state with get_state()
+    :param state: loaded app state shared by workers
+    :param function: function run for every task
+    :param tasks: list of arguments of the function
+    :param workers: number of worker processes, 1 runs tasks in this one
+    :param path: directory with preprocessed data, used by workers
+    which could not inherit the state
+    :param ordered: if results are in order of tasks or of completion
+    :return: generator of results
+    """
+    global _state
+    _state = state
+    if workers <= 1:
+        for task in tasks:
+            yield function(task)
+        return
+
+    start_methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context(
+        'fork' if 'fork' in start_methods else None)
+    with context.Pool(workers, initializer=init_worker,
+                      initargs=(path,)) as pool:
+        results = pool.imap if ordered else pool.imap_unordered
+        yield from results(function, tasks, chunksize=1)